@@ -0,0 +1,487 @@
+"""Бенчмарк слоя БД (database/requests.py) на сгенерированной базе.
+
+    python -m bench.db --rows 10k                    # база 10k пользователей / фидбеков
+    python -m bench.db --rows 1M --out result.json
+    python -m bench.db --rows 10k --save-baseline    # записать текущие цифры как эталон
+
+База генерируется один раз (--db, по умолчанию /tmp/bench_<rows>.db), а каждый прогон
+идёт на её свежей копии (<db>.run), так что пишущие случаи не копятся между запусками.
+Результат — JSON с p50/p99/mean в миллисекундах и ops/s по каждому случаю.
+Если для этого размера есть эталон в bench/baseline.json, то замедление p50 больше
+--tolerance или p99 больше --p99-tolerance (и в обоих случаях больше --min-delta-ms)
+роняет запуск с кодом 1. Эталон зависит от машины: снимайте его там же, где сравниваете.
+
+Случаи покрывают все публичные корутины database/requests.py, кроме async_main
+(она размечает базу перед прогоном).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+TG_ID_BASE = 10_000_000
+WORDS = [f"слово{i}" for i in range(2000)] + ["оплата", "ошибка", "сайт", "кнопка", "фото", "профиль", "сервер"]
+CATEGORIES = ("idea", "bug", "review")
+CHUNK = 50_000
+
+
+def parse_rows(value: str) -> int:
+    return SIZES.get(value) or int(value)
+
+
+# --- Генерация базы ---
+def _timestamps(count: int):
+    start = datetime.datetime(2023, 1, 1)
+    step = datetime.timedelta(days=730) / max(count, 1)
+    for i in range(count):
+        yield (start + step * i).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _chunks(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate(path: str, rows: int, seed: int = 1):
+    """Заполняет уже размеченную миграциями базу: rows пользователей, rows фидбеков, rows/10 жалоб"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    def text():
+        return " ".join(rng.choices(WORDS, k=rng.randint(6, 20)))
+
+    # Каждый 20-й фидбек — почти дубль одного из частых обращений, чтобы были кластеры похожих
+    frequent = [text().split() for _ in range(200)]
+
+    def feedback_text():
+        if rng.random() >= 0.05:
+            return text()
+        words = list(rng.choice(frequent))
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+        return " ".join(words)
+
+    tables = [
+        ("INSERT INTO users (telegram_id, username, full_name, admin, banned, registered_at) VALUES (?, ?, ?, 0, ?, ?)",
+         ((TG_ID_BASE + i, f"user{i}", f"User {i}", i % 50 == 0, ts)
+          for i, ts in enumerate(_timestamps(rows), start=1))),
+        ("INSERT INTO feedback (user_id, category, content_type, text, created_at) VALUES (?, ?, 'text', ?, ?)",
+         ((rng.randint(1, rows), CATEGORIES[i % 3], feedback_text(), ts) for i, ts in enumerate(_timestamps(rows)))),
+        ("INSERT INTO report (user_id, content_type, text, created_at) VALUES (?, 'text', ?, ?)",
+         ((rng.randint(1, rows), text(), ts) for ts in _timestamps(max(rows // 10, 1)))),
+    ]
+    for sql, data in tables:
+        for chunk in _chunks(data):
+            conn.executemany(sql, chunk)
+            conn.commit()
+        print(f"generated: {sql.split()[2]}", file=sys.stderr)
+    conn.close()
+
+
+# --- Случаи ---
+CASES = {}
+
+
+def case(name: str, iterations: int = None):
+    """Регистрирует случай: фабрика от контекста, возвращающая корутину от номера итерации"""
+    def decorator(factory):
+        CASES[name] = (factory, iterations)
+        return factory
+    return decorator
+
+
+def make_message(tg_id: int, name: str):
+    from aiogram.types import Chat, Message, User
+    return Message(
+        message_id=1, date=datetime.datetime.now(), chat=Chat(id=tg_id, type="private"),
+        from_user=User(id=tg_id, is_bot=False, first_name=name, username=f"u{tg_id}"), text="/start",
+    )
+
+
+def register_cases(rq):
+    from sqlalchemy import text
+    @case("add_user_new")
+    def _(ctx):
+        async def run(i):
+            tg_id = TG_ID_BASE * 10 + ctx["rng"].randrange(10 ** 9)
+            await rq.add_user(make_message(tg_id, "New"))
+        return run
+
+    @case("add_user_unchanged")
+    def _(ctx):
+        message = make_message(TG_ID_BASE + 1, "User 1")
+
+        async def run(i):
+            await rq.add_user(message)
+        return run
+
+    @case("upsert_users_batch500", iterations=50)
+    def _(ctx):
+        async def run(i):
+            ids = ctx["rng"].sample(range(1, ctx["rows"] + 1), 500)
+            await rq.upsert_users({TG_ID_BASE + n: (f"user{n}", f"Renamed {i}") for n in ids})
+        return run
+
+    @case("set_admin")
+    def _(ctx):
+        async def run(i):
+            await rq.set_admin(ctx["random_tg_id"]())
+        return run
+
+    @case("load_admin_ids")
+    def _(ctx):
+        async def run(i):
+            await rq.load_admin_ids()
+        return run
+
+    @case("get_user_flags_cold")
+    def _(ctx):
+        async def run(i):
+            rq.flags_cache.clear()
+            await rq.get_user_flags(ctx["random_tg_id"]())
+        return run
+
+    @case("is_admin_warm")
+    def _(ctx):
+        tg_id = ctx["random_tg_id"]()
+
+        async def run(i):
+            await rq.is_admin(tg_id)
+        return run
+
+    @case("is_blocked")
+    def _(ctx):
+        async def run(i):
+            await rq.is_blocked(ctx["random_tg_id"]())
+        return run
+
+    @case("toggle_ban_status")
+    def _(ctx):
+        async def run(i):
+            await rq.toggle_ban_status(ctx["random_tg_id"](), i % 2 == 0)
+        return run
+
+    @case("save_feedback")
+    def _(ctx):
+        async def run(i):
+            text = " ".join(ctx["rng"].choices(WORDS, k=12))
+            await rq.save_feedback(ctx["random_tg_id"](), CATEGORIES[i % 3], "text", text)
+        return run
+
+    @case("save_report")
+    def _(ctx):
+        async def run(i):
+            await rq.save_report(ctx["random_tg_id"](), "text", " ".join(ctx["rng"].choices(WORDS, k=12)))
+        return run
+
+    for item_type in ("feedback", "report"):
+        @case(f"get_items_paginated_{item_type}_first")
+        def _(ctx, item_type=item_type):
+            async def run(i):
+                await rq.get_items_paginated(item_type, 5)
+            return run
+
+        @case(f"get_items_paginated_{item_type}_deep")
+        def _(ctx, item_type=item_type):
+            # Курсор среди самых старых записей — глубокая страница
+            top = ctx["rows"] if item_type == "feedback" else max(ctx["rows"] // 10, 1)
+
+            async def run(i):
+                cursor_id = ctx["rng"].randint(1, max(top // 100, 2))
+                await rq.get_items_paginated(item_type, 5, "after" if i % 2 else "before", cursor_id)
+            return run
+
+    @case("get_users_paginated_first")
+    def _(ctx):
+        async def run(i):
+            await rq.get_users_paginated(5)
+        return run
+
+    @case("get_users_paginated_deep")
+    def _(ctx):
+        async def run(i):
+            cursor_id = ctx["rng"].randint(1, max(ctx["rows"] // 100, 2))
+            await rq.get_users_paginated(5, False, "after" if i % 2 else "before", cursor_id)
+        return run
+
+    @case("get_users_paginated_banned_deep")
+    def _(ctx):
+        async def run(i):
+            cursor_id = ctx["rng"].randint(1, max(ctx["rows"] // 100, 2)) * 50
+            await rq.get_users_paginated(5, True, "after", cursor_id)
+        return run
+
+    @case("get_item_by_id")
+    def _(ctx):
+        async def run(i):
+            await rq.get_item_by_id("feedback", ctx["rng"].randint(1, ctx["rows"]))
+        return run
+
+    @case("get_attachments")
+    def _(ctx):
+        async def run(i):
+            await rq.get_attachments("feedback", ctx["rng"].randint(1, ctx["rows"]))
+        return run
+
+    @case("get_user_by_telegram_id")
+    def _(ctx):
+        async def run(i):
+            await rq.get_user_by_telegram_id(ctx["random_tg_id"]())
+        return run
+
+    @case("get_counters")
+    def _(ctx):
+        async def run(i):
+            await rq.get_counters("feedback", "feedback:idea", "feedback:bug", "feedback:review")
+        return run
+
+    @case("search_items_rare")
+    def _(ctx):
+        async def run(i):
+            await rq.search_items("feedback", f"слово{ctx['rng'].randrange(2000)} слово{ctx['rng'].randrange(2000)}", 5)
+        return run
+
+    @case("search_items_common")
+    def _(ctx):
+        async def run(i):
+            await rq.search_items("feedback", "оплата", 5, 5 * (i % 10))
+        return run
+
+    @case("broadcast_progress")
+    def _(ctx):
+        broadcast = {}
+
+        async def run(i):
+            if "id" not in broadcast:
+                broadcast["id"] = (await rq.create_broadcast(1, 1)).id
+            await rq.save_broadcast_progress(broadcast["id"], i, i, 0)
+            await rq.get_broadcast(broadcast["id"])
+        return run
+
+    @case("get_running_broadcasts")
+    def _(ctx):
+        async def run(i):
+            await rq.get_running_broadcasts()
+        return run
+
+    @case("create_and_cancel_broadcast")
+    def _(ctx):
+        async def run(i):
+            broadcast = await rq.create_broadcast(1, 1)
+            await rq.cancel_broadcast(broadcast.id)
+        return run
+
+    @case("get_cluster_items")
+    def _(ctx):
+        cluster = {}
+
+        async def run(i):
+            if "id" not in cluster:
+                # Самый большой кластер (генератор кладёт почти-дубли, см. generate)
+                async with rq.read_engine.connect() as conn:
+                    cluster["id"] = await conn.scalar(text(
+                        "SELECT cluster_id FROM feedback WHERE cluster_id IS NOT NULL "
+                        "GROUP BY cluster_id ORDER BY count(*) DESC LIMIT 1"
+                    )) or 0
+            await rq.get_cluster_items(cluster["id"], 5, 5 * (i % 4))
+        return run
+
+    @case("stream_broadcast_recipients_1k")
+    def _(ctx):
+        async def run(i):
+            after = ctx["rng"].randint(0, max(ctx["rows"] - 1000, 0))
+            count = 0
+            async for _ in rq.stream_broadcast_recipients(after):
+                count += 1
+                if count >= 1000:
+                    break
+        return run
+
+    # Обслуживание: тяжёлые полные проходы, по одному замеру
+    @case("load_ban_index", iterations=1)
+    def _(ctx):
+        async def run(i):
+            await rq.load_ban_index()
+        return run
+
+    @case("reconcile_counters", iterations=1)
+    def _(ctx):
+        async def run(i):
+            await rq.reconcile_counters()
+        return run
+
+    @case("rebuild_search", iterations=1)
+    def _(ctx):
+        async def run(i):
+            await rq.rebuild_search()
+        return run
+
+    @case("recluster_feedback", iterations=1)
+    def _(ctx):
+        async def run(i):
+            await rq.recluster_feedback()
+        return run
+
+
+# --- Прогон ---
+def summarize(durations: list) -> dict:
+    ordered = sorted(durations)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "p50_ms": round(percentile(50) * 1000, 4),
+        "p99_ms": round(percentile(99) * 1000, 4),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "ops_per_sec": round(len(ordered) / total, 1) if total else None,
+    }
+
+
+async def run_cases(rq, rows: int, iterations: int, warmup: int, only: list, seed: int) -> dict:
+    rng = random.Random(seed)
+    ctx = {"rows": rows, "rng": rng, "random_tg_id": lambda: TG_ID_BASE + rng.randint(1, rows)}
+    results = {}
+    for name, (factory, fixed_iterations) in CASES.items():
+        if only and name not in only:
+            continue
+        run = factory(ctx)
+        count = fixed_iterations or iterations
+        for i in range(warmup if fixed_iterations is None else 0):
+            await run(i)
+        durations = []
+        for i in range(count):
+            started = time.perf_counter()
+            await run(i)
+            durations.append(time.perf_counter() - started)
+        results[name] = summarize(durations)
+        print(f"{name:40s} p50={results[name]['p50_ms']:>9.3f}ms p99={results[name]['p99_ms']:>9.3f}ms",
+              file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float, p99_tolerance: float, min_delta_ms: float) -> list:
+    """Список регрессий относительно эталона"""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        for key, allowed in (("p50_ms", tolerance), ("p99_ms", p99_tolerance)):
+            limit = base[key] * (1 + allowed) + min_delta_ms
+            if current[key] > limit:
+                regressions.append(f"{name}: {key} {current[key]:.3f} > {limit:.3f} (эталон {base[key]:.3f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10k", help="10k, 100k, 1M, 10M или число")
+    parser.add_argument("--db", help="Путь к базе (по умолчанию /tmp/bench_<rows>.db)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="Только эти случаи")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Записать результат как эталон")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Допустимое замедление p50, доля")
+    parser.add_argument("--p99-tolerance", type=float, default=1.0, help="Допустимое замедление p99, доля")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Разница меньше этой — шум")
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    template = os.path.abspath(args.db or f"/tmp/bench_{args.rows}.db")
+    path = template + ".run"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    fresh = not os.path.exists(template)
+    if not fresh:
+        shutil.copyfile(template, path)
+    # DATABASE_URL читается при импорте database.requests
+    os.environ["database_url"] = f"sqlite+aiosqlite:///{path}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import database.requests as rq
+
+    register_cases(rq)
+
+    async def run() -> dict:
+        await rq.async_main()
+        if fresh:
+            generate(path, rows, args.seed)
+            await rq.reconcile_counters()
+            await rq.rebuild_search()
+            await rq.recluster_feedback()
+            # Сохраняем нетронутую базу как шаблон для следующих прогонов
+            await rq.engine.dispose()
+            await rq.read_engine.dispose()
+            with sqlite3.connect(path) as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            shutil.copyfile(path, template)
+        await rq.load_ban_index()
+        await rq.load_admin_ids()
+        return await run_cases(rq, rows, args.iterations, args.warmup, args.only, args.seed)
+
+    results = asyncio.run(run())
+    report = {
+        "rows": rows,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[str(rows)] = {
+            name: {"p50_ms": r["p50_ms"], "p99_ms": r["p99_ms"]} for name, r in results.items()
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"baseline saved for {rows} rows", file=sys.stderr)
+        return
+
+    baseline = baselines.get(str(rows))
+    if baseline is None:
+        print(f"no baseline for {rows} rows", file=sys.stderr)
+        return
+    regressions = compare(results, baseline, args.tolerance, args.p99_tolerance, args.min_delta_ms)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""Нагрузочный тест всего бота против локальной заглушки Bot API.
+
+    python -m bench.loadtest --users 200 --duration 60
+    python -m bench.loadtest --users 1000 --admins 5 --think 1 4 --env throttle_global_limit=100000
+
+Заглушка (aiohttp) отвечает на методы Bot API как Telegram: getUpdates отдаёт
+апдейты виртуальных пользователей, остальные вызовы записываются и получают
+правдоподобный ответ. Бот — обычный main.py в отдельном процессе, ему только
+подменяется адрес API (api_server), база (временная) и порт /metrics.
+
+Виртуальный пользователь ходит по сценарию: /start, категория фидбека или жалоба,
+текст (иногда почти повтор чужого), иногда «Отмена». Админы открывают панель
+и листают списки, карточки и профили, нажимая кнопки из последней клавиатуры,
+которую прислал бот.
+
+Задержка апдейта — от выдачи его в getUpdates до первого вызова API в тот же
+чат (или answerCallbackQuery на этот callback). Результат — JSON: апдейты/с,
+p50/p90/p99 задержки, вызовы API на апдейт и разбивка по методам.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import signal
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Load test", "username": "loadtest_bot"}
+USER_ID_BASE = 50_000_000
+RESPONSE_TIMEOUT = 10.0
+# Методы, которые бот зовёт сам по себе, а не в ответ на апдейт
+SERVICE_METHODS = {"getUpdates", "getMe", "deleteWebhook", "setWebhook", "close", "logOut"}
+# Куда админ может нажимать: только чтение, без банов, ответов и рассылок
+ADMIN_BUTTONS = re.compile(r"^(menu:|view:|profile:|cluster:|home$|srch:)")
+PHRASES = [
+    "не грузится страница с расписанием", "кнопка оплаты не нажимается на телефоне",
+    "добавьте тёмную тему пожалуйста", "сайт очень медленно открывается вечером",
+    "хочу уведомления о новых поездах", "в профиле не сохраняется фото",
+    "спасибо за бота всё работает отлично", "ошибка при входе через телеграм",
+]
+
+
+def percentile(ordered: list, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: list) -> dict:
+    if not latencies:
+        return {"count": 0}
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeBotAPI:
+    """Заглушка Bot API: очередь апдейтов для getUpdates и журнал исходящих вызовов"""
+
+    def __init__(self):
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1000)
+        self.new_updates = asyncio.Event()
+        self.polling = asyncio.Event()      # Бот впервые пришёл за апдейтами
+        self.calls = {}                     # method -> количество
+        self.keyboards = {}                 # chat_id -> (message_id, [callback_data, ...])
+        self.waiters = {}                   # chat_id -> Future, ждущий первого вызова в этот чат
+        self.delivered_at = {}              # update_id -> время выдачи
+        self.callbacks = {}                 # callback_query_id -> chat_id
+
+    # --- Апдейты ---
+    def push(self, update: dict) -> int:
+        update_id = next(self.update_ids)
+        update["update_id"] = update_id
+        self.updates.append(update)
+        self.new_updates.set()
+        return update_id
+
+    async def get_updates(self, params: dict):
+        self.polling.set()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates and timeout:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = self.updates[:limit]
+        now = time.perf_counter()
+        for update in batch:
+            self.delivered_at.setdefault(update["update_id"], now)
+        return batch
+
+    # --- Ответы ---
+    def message(self, chat_id: int, params: dict, message_id: int = None) -> dict:
+        message_id = message_id or next(self.message_ids)
+        markup = params.get("reply_markup")
+        if markup:
+            buttons = [
+                button["callback_data"]
+                for row in json.loads(markup).get("inline_keyboard", [])
+                for button in row if "callback_data" in button
+            ]
+            self.keyboards[chat_id] = (message_id, buttons)
+        return {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER,
+            "text": params.get("text"),
+        }
+
+    def respond(self, method: str, params: dict):
+        chat_id = int(params["chat_id"]) if str(params.get("chat_id", "")).lstrip("-").isdigit() else None
+        if method == "getMe":
+            return BOT_USER
+        if method == "getChat":
+            return {"id": chat_id, "type": "private", "first_name": f"user{chat_id}",
+                    "accent_color_id": 0, "max_reaction_count": 11, "accepted_gift_types": {
+                        "unlimited_gifts": False, "limited_gifts": False,
+                        "unique_gifts": False, "premium_subscription": False,
+                    }}
+        if method == "getUserProfilePhotos":
+            return {"total_count": 0, "photos": []}
+        if method == "copyMessage":
+            return {"message_id": next(self.message_ids)}
+        if method == "sendMediaGroup":
+            return [self.message(chat_id, {}) for _ in json.loads(params.get("media") or "[]")]
+        if method.startswith("send"):
+            return self.message(chat_id, params)
+        if method.startswith("edit") and chat_id is not None:
+            return self.message(chat_id, params, int(params["message_id"]))
+        return True
+
+    def resolve(self, method: str, params: dict):
+        """Чей апдейт обслуживает этот вызов"""
+        if method == "answerCallbackQuery":
+            return self.callbacks.pop(params.get("callback_query_id"), None)
+        chat_id = params.get("chat_id")
+        return int(chat_id) if chat_id and str(chat_id).lstrip("-").isdigit() else None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self.get_updates(params)})
+
+        if method not in SERVICE_METHODS:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            waiter = self.waiters.pop(self.resolve(method, params), None)
+            if waiter and not waiter.done():
+                waiter.set_result(time.perf_counter())
+        return web.json_response({"ok": True, "result": self.respond(method, params)})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+class VirtualUsers:
+    """Сценарии пользователей и админов поверх FakeBotAPI"""
+
+    def __init__(self, api: FakeBotAPI, think: tuple, seed: int):
+        self.api = api
+        self.think = think
+        self.rng = random.Random(seed)
+        self.latencies = {}   # kind -> [секунды]
+        self.sent = 0
+        self.timeouts = 0
+
+    def user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"User {uid}", "username": f"load{uid}"}
+
+    def incoming(self, uid: int, text: str) -> dict:
+        message = {
+            "message_id": next(self.api.message_ids), "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"}, "from": self.user(uid), "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"message": message}
+
+    def callback(self, uid: int, data: str) -> dict:
+        message_id, _ = self.api.keyboards.get(uid, (next(self.api.message_ids), []))
+        query_id = f"{uid}:{next(self.api.message_ids)}"
+        self.api.callbacks[query_id] = uid
+        return {"callback_query": {
+            "id": query_id, "from": self.user(uid), "chat_instance": str(uid), "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()),
+                        "chat": {"id": uid, "type": "private"}, "from": BOT_USER, "text": "..."},
+        }}
+
+    async def send(self, uid: int, kind: str, update: dict):
+        """Кладёт апдейт в очередь и ждёт первой реакции бота"""
+        future = asyncio.get_running_loop().create_future()
+        self.api.waiters[uid] = future
+        update_id = self.api.push(update)
+        self.sent += 1
+        try:
+            answered = await asyncio.wait_for(future, RESPONSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.api.waiters.pop(uid, None)
+            return
+        delivered = self.api.delivered_at.pop(update_id, answered)
+        self.latencies.setdefault(kind, []).append(answered - delivered)
+
+    async def pause(self):
+        await asyncio.sleep(self.rng.uniform(*self.think))
+
+    def buttons(self, uid: int) -> list:
+        return self.api.keyboards.get(uid, (None, []))[1]
+
+    def feedback_text(self) -> str:
+        # Половина текстов — вариации одних и тех же фраз, чтобы работала кластеризация
+        if self.rng.random() < 0.5:
+            return f"{self.rng.choice(PHRASES)} {self.rng.choice(['', '!', ' уже третий день', ' (iphone)'])}"
+        return " ".join(f"слово{self.rng.randrange(5000)}" for _ in range(self.rng.randint(4, 30)))
+
+    async def run_user(self, uid: int, deadline: float):
+        await self.pause()
+        await self.send(uid, "start", self.incoming(uid, "/start"))
+        while time.monotonic() < deadline:
+            await self.pause()
+            roll = self.rng.random()
+            if roll < 0.15 or not self.buttons(uid):
+                await self.send(uid, "start", self.incoming(uid, "/start"))
+                continue
+            category = "report" if roll < 0.3 else self.rng.choice(["idea", "bug", "review"])
+            await self.send(uid, "callback", self.callback(uid, category))
+            await self.pause()
+            if self.rng.random() < 0.2:
+                await self.send(uid, "callback", self.callback(uid, "cancel_action"))
+            else:
+                await self.send(uid, "feedback", self.incoming(uid, self.feedback_text()))
+
+    async def run_admin(self, uid: int, deadline: float):
+        await self.pause()
+        await self.send(uid, "start", self.incoming(uid, "/start"))
+        while time.monotonic() < deadline:
+            await self.pause()
+            buttons = [data for data in self.buttons(uid) if ADMIN_BUTTONS.match(data)]
+            if "open_admin_panel" in self.buttons(uid) and self.rng.random() < 0.8:
+                await self.send(uid, "admin", self.callback(uid, "open_admin_panel"))
+            elif buttons:
+                await self.send(uid, "admin", self.callback(uid, self.rng.choice(buttons)))
+            else:
+                await self.send(uid, "start", self.incoming(uid, "/start"))
+
+
+async def seed_database(path: str, users: int, admins: int, items: int, seed: int):
+    """Готовит базу в отдельном процессе-харнессе: пользователи, админы и немного фидбека для листания"""
+    os.environ["database_url"] = f"sqlite+aiosqlite:///{path}"
+    sys.path.insert(0, ROOT)
+    import database.requests as rq
+
+    await rq.async_main()
+    await rq.upsert_users({
+        USER_ID_BASE + i: (f"load{USER_ID_BASE + i}", f"User {USER_ID_BASE + i}")
+        for i in range(users + admins)
+    })
+    for i in range(users, users + admins):
+        await rq.set_admin(USER_ID_BASE + i)
+    rng = random.Random(seed)
+    for i in range(items):
+        tg_id = USER_ID_BASE + rng.randrange(users or 1)
+        text = " ".join(f"слово{rng.randrange(5000)}" for _ in range(rng.randint(4, 30)))
+        if rng.random() < 0.2:
+            await rq.save_report(tg_id, "text", text)
+        else:
+            await rq.save_feedback(tg_id, rng.choice(["idea", "bug", "review"]), "text", text)
+    await rq.engine.dispose()
+    await rq.read_engine.dispose()
+
+
+async def scrape_metrics(port: int) -> dict:
+    """Пара цифр с /metrics бота, которые объясняют результат"""
+    wanted = ("bot_throttled_updates", "bot_api_retries_total", "bot_cleanup_backlog")
+    try:
+        async with ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                body = await response.text()
+    except Exception as e:
+        return {"error": str(e)}
+    result = {}
+    for line in body.splitlines():
+        series, _, value = line.partition(" ")
+        name = series.partition("{")[0]  # Серии с метками складываем
+        if name in wanted:
+            result[name] = result.get(name, 0) + float(value)
+    return result
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    db_path = os.path.join(workdir, "storage.db")
+    os.chdir(workdir)  # database.requests создаёт data/ в текущей папке
+    await seed_database(db_path, args.users, args.admins, args.items, args.seed)
+
+    api = FakeBotAPI()
+    api_port, metrics_port = free_port(), free_port()
+    runner = web.AppRunner(api.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    env = dict(
+        os.environ,
+        bot_token=TOKEN, api_server=f"http://127.0.0.1:{api_port}",
+        database_url=f"sqlite+aiosqlite:///{db_path}",
+        webhook_url="", web_host="127.0.0.1", web_port=str(metrics_port),
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log = open(os.path.join(workdir, "bot.log"), "wb")
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "main.py"), cwd=workdir, env=env, stdout=log, stderr=log,
+    )
+
+    try:
+        started = asyncio.ensure_future(api.polling.wait())
+        exited = asyncio.ensure_future(bot.wait())
+        await asyncio.wait([started, exited], timeout=60, return_when=asyncio.FIRST_COMPLETED)
+        if not started.done():
+            started.cancel()
+            raise SystemExit(f"bot did not start polling, see {log.name}")
+        exited.cancel()
+
+        users = VirtualUsers(api, tuple(args.think), args.seed)
+        began = time.monotonic()
+        deadline = began + args.duration
+        await asyncio.gather(
+            *(users.run_user(USER_ID_BASE + i, deadline) for i in range(args.users)),
+            *(users.run_admin(USER_ID_BASE + i, deadline) for i in range(args.users, args.users + args.admins)),
+        )
+        elapsed = time.monotonic() - began
+        bot_metrics = await scrape_metrics(metrics_port)
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(bot.wait(), 15)
+            except asyncio.TimeoutError:
+                bot.kill()
+        log.close()
+        await runner.cleanup()
+
+    answered = sum(len(v) for v in users.latencies.values())
+    total_calls = sum(api.calls.values())
+    return {
+        "users": args.users,
+        "admins": args.admins,
+        "duration_s": round(elapsed, 1),
+        "updates_sent": users.sent,
+        "updates_answered": answered,
+        "timeouts": users.timeouts,
+        "updates_per_sec": round(answered / elapsed, 2),
+        "latency": summarize([x for v in users.latencies.values() for x in v]),
+        "latency_by_kind": {kind: summarize(v) for kind, v in sorted(users.latencies.items())},
+        "api_calls": {
+            "total": total_calls,
+            "per_update": round(total_calls / users.sent, 2) if users.sent else None,
+            "by_method": dict(sorted(api.calls.items(), key=lambda kv: -kv[1])),
+        },
+        "bot": bot_metrics,
+        "workdir": workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="Виртуальных пользователей")
+    parser.add_argument("--admins", type=int, default=2, help="Виртуальных админов (листают списки)")
+    parser.add_argument("--duration", type=float, default=60, help="Секунд нагрузки")
+    parser.add_argument("--think", type=float, nargs=2, default=(3.0, 9.0), metavar=("MIN", "MAX"),
+                        help="Пауза пользователя между действиями, секунд")
+    parser.add_argument("--items", type=int, default=300, help="Фидбека в базе до старта (для листания)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Доп. переменные окружения для бота, например throttle_global_limit=100000")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="Куда записать JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+    if args.out:
+        args.out = os.path.abspath(args.out)  # run() переходит во временную папку
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Кластеризация почти одинакового фидбека: MinHash + LSH.
+
+Текст режется на символьные шинглы, из них считается MinHash-подпись из
+NUM_PERM чисел. Подпись делится на BANDS полос по ROWS чисел; у похожих
+текстов хотя бы одна полоса с большой вероятностью совпадает целиком.
+Поэтому кандидатов ищем по индексу (band, bucket) в feedback_lsh, а не
+перебором, и уже их сверяем по подписи.
+
+Подписи и корзины держим только для последних SIMILARITY_WINDOW обращений,
+так что размер индекса не растёт вместе с таблицей.
+
+Все функции работают с синхронным Connection (из миграций или session.run_sync).
+Подпись считается заранее и отдельно (signature — чистый Python, десятки мс),
+чтобы не держать на ней ни event loop, ни транзакцию записи.
+"""
+import hashlib
+import random
+import re
+import zlib
+from array import array
+from typing import Iterator, Optional
+
+from sqlalchemy import Connection
+
+NUM_PERM = 64
+BANDS, ROWS = 16, 4          # BANDS * ROWS == NUM_PERM; порог срабатывания LSH ~ (1/16)^(1/4) ≈ 0.5
+SHINGLE_SIZE = 4             # Символов в шингле
+SIMILARITY_THRESHOLD = 0.6   # Оценка Жаккара, с которой считаем тексты дублями
+MIN_SHINGLES = 5             # Слишком короткие тексты («не работает») не кластеризуем
+MAX_TEXT_LENGTH = 2000
+MAX_CANDIDATES = 50
+SIMILARITY_WINDOW = 20000    # Сколько последних обращений участвуют в поиске похожих
+PRUNE_EVERY = 1000
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(NUM_PERM)]
+
+
+def signature(text: str) -> Optional[array]:
+    """MinHash-подпись текста или None, если текст слишком короткий"""
+    normalized = ' '.join(re.findall(r'\w+', text[:MAX_TEXT_LENGTH].lower()))
+    shingles = {
+        zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode())
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    return array('I', (
+        min(((a * h + b) % _PRIME) & 0xFFFFFFFF for h in shingles)
+        for a, b in _PERMUTATIONS
+    ))
+
+
+def band_keys(sig: array, category: str) -> Iterator[tuple]:
+    """(band, bucket) для каждой полосы; категория в ключе — баги не смешиваются с идеями"""
+    for band in range(BANDS):
+        chunk = sig[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(category.encode() + chunk, digest_size=8).digest()
+        yield band, int.from_bytes(digest, 'big', signed=True)
+
+
+def similarity(a: array, b: array) -> float:
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def assign_cluster(conn: Connection, feedback_id: int, category: str, sig: array) -> int:
+    """Кладёт обращение с подписью sig (см. signature) в кластер похожих (или в новый)
+    и делает его головой. Возвращает id кластера"""
+    keys = list(band_keys(sig, category))
+
+    buckets = ' OR '.join('(band = ? AND bucket = ?)' for _ in keys)
+    candidates = conn.exec_driver_sql(
+        "SELECT s.feedback_id, s.signature, f.cluster_id FROM feedback_signatures s "
+        "JOIN feedback f ON f.id = s.feedback_id "
+        f"WHERE s.feedback_id IN (SELECT feedback_id FROM feedback_lsh WHERE {buckets}) "
+        "ORDER BY s.feedback_id DESC LIMIT ?",
+        (*[value for key in keys for value in key], MAX_CANDIDATES),
+    ).all()
+
+    best_cluster, best_score = None, SIMILARITY_THRESHOLD
+    for _, candidate_sig, cluster_id in candidates:
+        score = similarity(sig, array('I', candidate_sig))
+        if cluster_id is not None and score >= best_score:
+            best_cluster, best_score = cluster_id, score
+
+    if best_cluster is None:
+        best_cluster = conn.exec_driver_sql(
+            "INSERT INTO feedback_clusters (category, size, last_feedback_id, updated_at) "
+            "VALUES (?, 1, ?, CURRENT_TIMESTAMP)",
+            (category, feedback_id),
+        ).lastrowid
+    else:
+        # Прежняя голова уходит из списка, новое обращение поднимает кластер наверх
+        conn.exec_driver_sql(
+            "UPDATE feedback SET cluster_head = 0 "
+            "WHERE id = (SELECT last_feedback_id FROM feedback_clusters WHERE id = ?)",
+            (best_cluster,),
+        )
+        conn.exec_driver_sql(
+            "UPDATE feedback_clusters SET size = size + 1, last_feedback_id = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE id = ?",
+            (feedback_id, best_cluster),
+        )
+
+    conn.exec_driver_sql(
+        "UPDATE feedback SET cluster_id = ?, cluster_head = 1 WHERE id = ?", (best_cluster, feedback_id)
+    )
+    conn.exec_driver_sql(
+        "INSERT OR REPLACE INTO feedback_signatures (feedback_id, signature) VALUES (?, ?)",
+        (feedback_id, sig.tobytes()),
+    )
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO feedback_lsh (band, bucket, feedback_id) VALUES (?, ?, ?)",
+        [(band, bucket, feedback_id) for band, bucket in keys],
+    )
+
+    if feedback_id % PRUNE_EVERY == 0:
+        prune_index(conn, feedback_id - SIMILARITY_WINDOW)
+    return best_cluster
+
+
+def prune_index(conn: Connection, below_id: int):
+    """Выкидывает из индекса похожести обращения старше окна"""
+    conn.exec_driver_sql("DELETE FROM feedback_lsh WHERE feedback_id <= ?", (below_id,))
+    conn.exec_driver_sql("DELETE FROM feedback_signatures WHERE feedback_id <= ?", (below_id,))
+
+
+def rebuild_clusters(conn: Connection):
+    """Пересобирает кластеры с нуля по последним SIMILARITY_WINDOW обращениям"""
+    conn.exec_driver_sql("DELETE FROM feedback_lsh")
+    conn.exec_driver_sql("DELETE FROM feedback_signatures")
+    conn.exec_driver_sql("UPDATE feedback SET cluster_id = NULL, cluster_head = 1")
+    conn.exec_driver_sql("DELETE FROM feedback_clusters")
+
+    rows = conn.exec_driver_sql(
+        "SELECT id, category, text FROM feedback WHERE text IS NOT NULL ORDER BY id DESC LIMIT ?",
+        (SIMILARITY_WINDOW,),
+    ).all()
+    for feedback_id, category, text in reversed(rows):
+        sig = signature(text)
+        if sig is not None:
+            assign_cluster(conn, feedback_id, category, sig)
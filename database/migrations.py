@@ -0,0 +1,150 @@
+"""Версионные миграции схемы. Текущая версия хранится в PRAGMA user_version.
+
+Новая миграция — это функция от синхронного Connection, добавленная в конец MIGRATIONS.
+На свежей базе v1 создаёт уже актуальные таблицы из моделей, поэтому каждый
+следующий шаг должен быть идемпотентным (IF NOT EXISTS, проверка колонок и т.п.).
+"""
+from sqlalchemy import Connection
+
+from database.models import (
+    Base, Counter, FsmRecord, Broadcast, FeedbackCluster, FeedbackSignature, FeedbackBucket, Attachment
+)
+
+FEEDBACK_CATEGORIES = ('idea', 'bug', 'review')
+
+# Полнотекстовые индексы: таблица -> FTS5-таблица над её колонкой text
+FTS_TABLES = {'feedback': 'feedback_fts', 'report': 'report_fts'}
+
+
+def _v1_baseline(conn: Connection):
+    """Таблицы из моделей (на старой базе — только недостающие)"""
+    Base.metadata.create_all(conn)
+
+
+def _v2_list_indexes(conn: Connection):
+    """Индексы под сортировку и фильтры админских списков"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_feedback_created_at ON feedback (created_at)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_report_created_at ON report (created_at)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_users_registered_at ON users (registered_at)")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_users_banned_registered_at ON users (banned, registered_at)"
+    )
+
+
+def rebuild_counters(conn: Connection):
+    """Пересчитывает таблицу counters с нуля по реальным данным"""
+    conn.exec_driver_sql("DELETE FROM counters")
+    conn.exec_driver_sql("INSERT INTO counters (key, value) SELECT 'feedback', count(*) FROM feedback")
+    conn.exec_driver_sql("INSERT INTO counters (key, value) SELECT 'report', count(*) FROM report")
+    conn.exec_driver_sql("INSERT INTO counters (key, value) SELECT 'users', count(*) FROM users")
+    conn.exec_driver_sql("INSERT INTO counters (key, value) SELECT 'users:banned', count(*) FROM users WHERE banned = 1")
+    for category in FEEDBACK_CATEGORIES:
+        conn.exec_driver_sql(
+            "INSERT INTO counters (key, value) SELECT ?, count(*) FROM feedback WHERE category = ?",
+            (f"feedback:{category}", category),
+        )
+
+
+def _v3_counters(conn: Connection):
+    """Таблица счётчиков вместо COUNT(*) на каждый рендер списка"""
+    Counter.__table__.create(conn, checkfirst=True)
+    rebuild_counters(conn)
+
+
+def _v4_fsm_storage(conn: Connection):
+    """Персистентное хранилище FSM"""
+    FsmRecord.__table__.create(conn, checkfirst=True)
+
+
+def _v5_broadcasts(conn: Connection):
+    """Рассылки с сохранённым прогрессом"""
+    Broadcast.__table__.create(conn, checkfirst=True)
+
+
+def rebuild_search_index(conn: Connection):
+    """Перестраивает FTS-индексы целиком по содержимому таблиц"""
+    for fts in FTS_TABLES.values():
+        conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _v6_full_text_search(conn: Connection):
+    """FTS5 по тексту фидбека и жалоб; триггеры держат индекс в актуальном состоянии"""
+    for table, fts in FTS_TABLES.items():
+        # external content: текст не дублируется, в индексе только токены
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"text, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF text ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); "
+            f"INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END"
+        )
+    rebuild_search_index(conn)
+
+
+def _v7_feedback_clusters(conn: Connection):
+    """Кластеры похожего фидбека (MinHash/LSH, см. database/clusters.py).
+    Существующие записи кластеризуются офлайн: python manage.py rebuild-clusters"""
+    FeedbackCluster.__table__.create(conn, checkfirst=True)
+    FeedbackSignature.__table__.create(conn, checkfirst=True)
+    FeedbackBucket.__table__.create(conn, checkfirst=True)
+
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(feedback)")}
+    if 'cluster_id' not in columns:
+        conn.exec_driver_sql("ALTER TABLE feedback ADD COLUMN cluster_id INTEGER REFERENCES feedback_clusters (id)")
+    if 'cluster_head' not in columns:
+        conn.exec_driver_sql("ALTER TABLE feedback ADD COLUMN cluster_head BOOLEAN NOT NULL DEFAULT 1")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_feedback_cluster_head_created_at ON feedback (cluster_head, created_at)"
+    )
+
+
+def _v8_attachments(conn: Connection):
+    """Вложения альбомов"""
+    Attachment.__table__.create(conn, checkfirst=True)
+
+
+def _v9_cluster_members(conn: Connection):
+    """Индекс под список обращений одного кластера"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_feedback_cluster_id_id ON feedback (cluster_id, id)")
+
+
+MIGRATIONS = [
+    _v1_baseline,
+    _v2_list_indexes,
+    _v3_counters,
+    _v4_fsm_storage,
+    _v5_broadcasts,
+    _v6_full_text_search,
+    _v7_feedback_clusters,
+    _v8_attachments,
+    _v9_cluster_members,
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn: Connection) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def set_version(conn: Connection, version: int):
+    # PRAGMA не принимает параметры, version — всегда int
+    conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def migrate(conn: Connection):
+    """Доводит схему до LATEST_VERSION"""
+    version = get_version(conn)
+    for number, step in enumerate(MIGRATIONS, start=1):
+        if number > version:
+            step(conn)
+            set_version(conn, number)
@@ -1,5 +1,5 @@
 from typing import Optional
-from sqlalchemy import BigInteger, String, DateTime, func, Boolean, ForeignKey, Integer, Text
+from sqlalchemy import BigInteger, String, DateTime, func, Boolean, ForeignKey, Integer, Text, Index, LargeBinary
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs
 
@@ -15,11 +15,14 @@ class User(Base):
     full_name: Mapped[str] = mapped_column(String, nullable=True)
     admin: Mapped[bool] = mapped_column(Boolean, nullable=True, default=False)
     banned: Mapped[bool] = mapped_column(Boolean, nullable=True, default=False)
-    registered_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+    registered_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now(), index=True)
 
     feedbacks: Mapped[list["Feedback"]] = relationship(back_populates="user")
     reports: Mapped[list["Report"]] = relationship(back_populates="user")
 
+    # Бан-лист фильтрует по banned и сортирует по registered_at
+    __table_args__ = (Index('ix_users_banned_registered_at', 'banned', 'registered_at'),)
+
 class Feedback(Base):
     __tablename__ = 'feedback'
 
@@ -37,7 +40,18 @@ class Feedback(Base):
     text: Mapped[Optional[str]] = mapped_column(String, nullable=True) # Текст или подпись к чему-то
     file_id: Mapped[Optional[str]] = mapped_column(String, nullable=True) # Telegram ID файла
     
-    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now(), index=True)
+
+    # Кластер похожих обращений (см. database/clusters.py).
+    # В списке показывается только голова кластера — самое свежее обращение
+    cluster_id: Mapped[Optional[int]] = mapped_column(ForeignKey('feedback_clusters.id'), nullable=True)
+    cluster: Mapped[Optional["FeedbackCluster"]] = relationship()
+    cluster_head: Mapped[bool] = mapped_column(Boolean, default=True, server_default='1')
+
+    __table_args__ = (
+        Index('ix_feedback_cluster_head_created_at', 'cluster_head', 'created_at'),
+        Index('ix_feedback_cluster_id_id', 'cluster_id', 'id'),
+    )
 
 class Report(Base):
     __tablename__ = 'report'
@@ -53,4 +67,79 @@ class Report(Base):
     text: Mapped[Optional[str]] = mapped_column(String, nullable=True) # Описание
     file_id: Mapped[Optional[str]] = mapped_column(String, nullable=True) # Telegram ID файла
 
-    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
\ No newline at end of file
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now(), index=True)
+
+class Counter(Base):
+    """Счётчики для списков админки, обновляются в тех же транзакциях, что и данные"""
+    __tablename__ = 'counters'
+
+    # 'feedback', 'feedback:bug', 'report', 'users', 'users:banned' и т.п.
+    key: Mapped[str] = mapped_column(String(50), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, default=0)
+
+class FsmRecord(Base):
+    """Состояние и данные FSM (см. database/storage.py)"""
+    __tablename__ = 'fsm_storage'
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    data: Mapped[str] = mapped_column(Text, default='{}')  # JSON
+    updated_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now(), index=True)
+
+class Broadcast(Base):
+    """Рассылка по всем пользователям; прогресс сохраняется, чтобы пережить рестарт"""
+    __tablename__ = 'broadcasts'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+
+    # Что рассылаем: копия сообщения админа
+    admin_chat_id: Mapped[int] = mapped_column(BigInteger)
+    message_id: Mapped[int] = mapped_column(Integer)
+
+    # running | done | cancelled | failed
+    status: Mapped[str] = mapped_column(String(20), default='running', index=True)
+    last_user_id: Mapped[int] = mapped_column(Integer, default=0)  # users.id, на котором остановились
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+    finished_at: Mapped[Optional[DateTime]] = mapped_column(DateTime, nullable=True)
+
+class FeedbackCluster(Base):
+    """Группа почти одинаковых обращений"""
+    __tablename__ = 'feedback_clusters'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    category: Mapped[str] = mapped_column(String(50))
+    size: Mapped[int] = mapped_column(Integer, default=1)
+    last_feedback_id: Mapped[int] = mapped_column(Integer)  # Текущая голова кластера
+    updated_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+
+class FeedbackSignature(Base):
+    """MinHash-подпись текста обращения (хранятся только для последних SIMILARITY_WINDOW)"""
+    __tablename__ = 'feedback_signatures'
+
+    feedback_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    signature: Mapped[bytes] = mapped_column(LargeBinary)
+
+class FeedbackBucket(Base):
+    """LSH-корзины подписей: поиск похожих — по индексу, а не перебором"""
+    __tablename__ = 'feedback_lsh'
+
+    band: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bucket: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    feedback_id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+
+class Attachment(Base):
+    """Файлы альбома, присланного как фидбек или жалоба (по строке на файл)"""
+    __tablename__ = 'attachments'
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    owner_type: Mapped[str] = mapped_column(String(20))  # feedback | report
+    owner_id: Mapped[int] = mapped_column(Integer)
+    position: Mapped[int] = mapped_column(Integer, default=0)  # Порядок в альбоме
+    content_type: Mapped[str] = mapped_column(String(50))
+    file_id: Mapped[str] = mapped_column(String)
+
+    __table_args__ = (Index('ix_attachments_owner', 'owner_type', 'owner_id', 'position'),)
@@ -1,37 +1,186 @@
+import asyncio
 import os
+import re
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy import select, func, desc
-from sqlalchemy.orm import joinedload
-from database.models import Base, User, Feedback, Report
+from sqlalchemy import select, update, desc, asc, event, tuple_, or_, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, aliased
+from database.models import User, Feedback, Report, Counter, Broadcast, Attachment
+from database.migrations import migrate, rebuild_counters, rebuild_search_index, FTS_TABLES
+from database.clusters import assign_cluster, rebuild_clusters, signature
 from aiogram.types import Message
+from utils.cache import LRUCache
+from utils.ban_index import BanIndex
+from utils.config import DATABASE_URL
+from utils.metrics import instrument_engine
 
 if not os.path.exists('data'):
     os.makedirs('data')
 
-engine = create_async_engine(url='sqlite+aiosqlite:///data/storage.db')
+engine = create_async_engine(url=DATABASE_URL)
 async_session = async_sessionmaker(engine)
 
+# Отдельный пул только на чтение для админских списков: в WAL читатели
+# не блокируют запись, и тяжёлая пагинация не мешает пользовательским INSERT
+read_engine = create_async_engine(url=DATABASE_URL, pool_size=4)
+read_session = async_sessionmaker(read_engine)
+
+instrument_engine(engine, "write")
+instrument_engine(read_engine, "read")
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_write_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 МБ
+    cursor.execute("PRAGMA cache_size=-65536")    # 64 МБ
+    cursor.close()
+
+
+@event.listens_for(read_engine.sync_engine, "connect")
+def _set_read_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-32768")
+    cursor.close()
+
+# Кэш флагов пользователя: telegram_id -> (admin, banned)
+# Пишется насквозь из set_admin / toggle_ban_status, так что TTL — лишь страховка
+FLAGS_CACHE_TTL = 600
+flags_cache = LRUCache(maxsize=50000, ttl=FLAGS_CACHE_TTL)
+
+# Последние известные (username, full_name) — чтобы не писать в БД то, что там уже есть
+profile_fingerprints = LRUCache(maxsize=100000)
+
+# Индекс всех забаненных, грузится целиком на старте (см. load_ban_index)
+ban_index = BanIndex()
+
+# telegram_id всех админов (их мало), грузится на старте (см. load_admin_ids)
+admin_ids: set[int] = set()
+
+# Версии данных для кэша отрисованных списков в админке: растут при любом изменении
+data_versions: dict[str, int] = {"feedback": 0, "report": 0, "users": 0}
+
+# Слушатели изменений кэшей выше: kind, args. В режиме нескольких процессов
+# воркер пересылает их остальным (см. utils/workers.py), а те применяют через apply_change
+change_listeners: list = []
+
+# Слушатели новых обращений: (item_type, item), где item — dict с полями карточки.
+# Сюда подписан utils/notify.py, который рассылает уведомления админам
+item_listeners: list = []
+
+def _item_info(item, user) -> dict:
+    """Снимок обращения до commit (после него атрибуты ORM-объекта истекают)"""
+    return {
+        'id': item.id, 'category': getattr(item, 'category', None), 'content_type': item.content_type,
+        'text': item.text, 'username': user.username, 'full_name': user.full_name,
+    }
+
+def _new_item(item_type: str, info: dict):
+    for listener in item_listeners:
+        listener(item_type, info)
+
+def _changed(kind: str, *args):
+    for listener in change_listeners:
+        listener(kind, args)
+
+def _bump_local(names):
+    for name in names:
+        data_versions[name] = data_versions.get(name, 0) + 1
+
+def bump_version(*names: str):
+    _bump_local(names)
+    _changed('versions', *names)
+
+def _set_flags(tg_id: int, admin: bool, banned: bool):
+    flags_cache.set(tg_id, (admin, banned))
+    if admin:
+        admin_ids.add(tg_id)
+    else:
+        admin_ids.discard(tg_id)
+    if banned:
+        ban_index.add(tg_id)
+    else:
+        ban_index.discard(tg_id)
+
+def apply_change(kind: str, args):
+    """Применяет изменение, сделанное в другом процессе (без повторной рассылки)"""
+    if kind == 'versions':
+        _bump_local(args)
+    elif kind == 'flags':
+        _set_flags(*args)
+
 async def async_main():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate)
+
+# --- Счётчики ---
+async def _bump(session, key: str, delta: int = 1):
+    """Изменяет счётчик в рамках текущей транзакции"""
+    stmt = sqlite_insert(Counter).values(key=key, value=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Counter.key],
+        set_={"value": Counter.value + stmt.excluded.value},
+    )
+    await session.execute(stmt)
+
+async def get_counters(*keys: str) -> dict[str, int]:
+    """Возвращает значения счётчиков (отсутствующие — 0)"""
+    async with read_session() as session:
+        result = await session.execute(select(Counter.key, Counter.value).where(Counter.key.in_(keys)))
+        values = dict(result.all())
+    return {key: values.get(key, 0) for key in keys}
+
+async def reconcile_counters():
+    """Пересобирает счётчики с нуля (если вдруг разъехались с данными)"""
+    async with engine.begin() as conn:
+        await conn.run_sync(rebuild_counters)
 
 # --- Пользователи ---
 async def add_user(message: Message):
     tg_id = message.from_user.id
-    username = message.from_user.username
-    full_name = message.from_user.full_name
+    fingerprint = (message.from_user.username, message.from_user.full_name)
+
+    # Профиль уже записан в БД именно таким. Очередь ProfileRefreshMiddleware не в счёт:
+    # её запись может опоздать или не удаться, а строка users нужна сразу (save_feedback)
+    if profile_fingerprints.get(tg_id) == fingerprint:
+        return
 
+    await upsert_users({tg_id: fingerprint})
+    profile_fingerprints.set(tg_id, fingerprint)
+
+async def upsert_users(profiles: dict[int, tuple]):
+    """Пакетный INSERT ... ON CONFLICT DO UPDATE: {telegram_id: (username, full_name)}"""
+    rows = [
+        {"telegram_id": tg_id, "username": username, "full_name": full_name}
+        for tg_id, (username, full_name) in profiles.items()
+    ]
+    if not rows:
+        return
+
+    # Сначала вставляем новых (rowcount = сколько реально добавилось), потом обновляем всех
+    insert_stmt = sqlite_insert(User).values(rows).on_conflict_do_nothing(index_elements=[User.telegram_id])
+    update_stmt = sqlite_insert(User).values(rows)
+    update_stmt = update_stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={"username": update_stmt.excluded.username, "full_name": update_stmt.excluded.full_name},
+    )
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == tg_id))
-        
-        if not user:
-            session.add(User(telegram_id=tg_id, username=username, full_name=full_name))
-            await session.commit()
-        else:
-            if user.username != username or user.full_name != full_name:
-                user.username = username
-                user.full_name = full_name
-                await session.commit()
+        inserted = (await session.execute(insert_stmt)).rowcount
+        await session.execute(update_stmt)
+        if inserted:
+            await _bump(session, 'users', inserted)
+        await session.commit()
+    # Смена имени в списках не стоит сброса всех закэшированных страниц: новое имя
+    # появится, когда страница перерисуется по другой причине
+    if inserted:
+        bump_version('users')
 
 async def set_admin(tg_id: int):
     """Временная функция чтобы выдать админку вручную или через код"""
@@ -39,95 +188,336 @@ async def set_admin(tg_id: int):
         user = await session.scalar(select(User).where(User.telegram_id == tg_id))
         if user:
             user.admin = True
+            flags = (True, bool(user.banned))
             await session.commit()
+            _set_flags(tg_id, *flags)
+            _changed('flags', tg_id, *flags)
 
-async def is_admin(tg_id: int) -> bool:
+async def load_admin_ids():
+    """Заполняет admin_ids"""
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == tg_id))
-        return user.admin if user else False
+        result = await session.scalars(select(User.telegram_id).where(User.admin == True))
+        admin_ids.clear()
+        admin_ids.update(result.all())
 
-async def get_users_paginated(page: int = 1, limit: int = 10, only_banned: bool = False):
-    offset = (page - 1) * limit
-    async with async_session() as session:
+async def get_user_flags(tg_id: int) -> tuple[bool, bool]:
+    """Возвращает (admin, banned) из кэша, в БД идёт только при промахе"""
+    flags = flags_cache.get(tg_id)
+    if flags is None:
+        async with async_session() as session:
+            row = (await session.execute(
+                select(User.admin, User.banned).where(User.telegram_id == tg_id)
+            )).first()
+        flags = (bool(row.admin), bool(row.banned)) if row else (False, False)
+        flags_cache.set(tg_id, flags)
+    return flags
+
+async def is_admin(tg_id: int) -> bool:
+    admin, _ = await get_user_flags(tg_id)
+    return admin
+
+# --- Пагинация ---
+async def _keyset_page(session, stmt, Model, sort_col: str, limit: int, direction: str = None, cursor_id: int = None):
+    """Страница по ключу (sort_col, id) от новых к старым, без OFFSET.
+
+    direction: None — первая страница, 'after' — строго после курсора,
+    'from' — начиная с курсора включительно, 'before' — строго до курсора (назад).
+    Возвращает (items, has_prev, has_next).
+    """
+    key = tuple_(getattr(Model, sort_col), Model.id)
+    if direction is not None and cursor_id is not None:
+        # Ключ курсора берём подзапросом, чтобы сравнивать сырые значения из БД
+        cursor = aliased(Model)
+        cursor_key = select(getattr(cursor, sort_col), cursor.id).where(cursor.id == cursor_id).scalar_subquery()
+
+        if direction == 'before':
+            rows = (await session.scalars(
+                stmt.where(key > cursor_key).order_by(asc(getattr(Model, sort_col)), asc(Model.id)).limit(limit + 1)
+            )).all()
+            # Дошли до начала списка — просто отдаём первую страницу
+            if len(rows) > limit:
+                return list(reversed(rows[:limit])), True, True
+        else:
+            condition = key < cursor_key if direction == 'after' else key <= cursor_key
+            rows = (await session.scalars(
+                stmt.where(condition).order_by(desc(getattr(Model, sort_col)), desc(Model.id)).limit(limit + 1)
+            )).all()
+            if rows:
+                return rows[:limit], True, len(rows) > limit
+
+    rows = (await session.scalars(
+        stmt.order_by(desc(getattr(Model, sort_col)), desc(Model.id)).limit(limit + 1)
+    )).all()
+    return rows[:limit], False, len(rows) > limit
+
+async def _get_counter(session, key: str) -> int:
+    return await session.scalar(select(Counter.value).where(Counter.key == key)) or 0
+
+async def get_users_paginated(limit: int = 10, only_banned: bool = False, direction: str = None, cursor_id: int = None):
+    """Возвращает (users, total, has_prev, has_next) для страницы списка пользователей"""
+    async with read_session() as session:
         stmt = select(User)
         if only_banned:
             stmt = stmt.where(User.banned == True)
-        
-        # Получаем общее кол-во для подсчета страниц
-        count_stmt = select(func.count()).select_from(User)
-        if only_banned:
-            count_stmt = count_stmt.where(User.banned == True)
-        total = await session.scalar(count_stmt)
 
-        result = await session.scalars(stmt.offset(offset).limit(limit).order_by(desc(User.registered_at)))
-        return result.all(), total
+        users, has_prev, has_next = await _keyset_page(session, stmt, User, 'registered_at', limit, direction, cursor_id)
+        total = await _get_counter(session, 'users:banned' if only_banned else 'users')
+        return users, total, has_prev, has_next
 
 # --- Блокировка ---
 async def toggle_ban_status(tg_id: int, status: bool):
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.telegram_id == tg_id))
         if user:
+            if bool(user.banned) != status:
+                await _bump(session, 'users:banned', 1 if status else -1)
             user.banned = status
+            flags = (bool(user.admin), status)
             await session.commit()
+            _set_flags(tg_id, *flags)
+            _changed('flags', tg_id, *flags)
+            bump_version('users')
             return True
         return False
 
 async def is_blocked(tg_id: int) -> bool:
+    if ban_index.loaded:
+        return tg_id in ban_index
+    _, banned = await get_user_flags(tg_id)
+    return banned
+
+async def load_ban_index():
+    """Заполняет ban_index всеми забаненными telegram_id"""
     async with async_session() as session:
-        user = await session.scalar(select(User).where(User.telegram_id == tg_id))
-        return user.banned if user else False
+        result = await session.scalars(select(User.telegram_id).where(User.banned == True))
+        ban_index.load(result.all())
 
 # --- Фидбек и Репорты ---
-async def save_feedback(tg_id: int, category: str, content_type: str, text: str = None, file_id: str = None):
+def _add_attachments(session, owner_type: str, owner_id: int, attachments: list):
+    """attachments: [(content_type, file_id), ...] в порядке альбома"""
+    session.add_all([
+        Attachment(owner_type=owner_type, owner_id=owner_id, position=position,
+                   content_type=content_type, file_id=file_id)
+        for position, (content_type, file_id) in enumerate(attachments or [])
+    ])
+
+async def save_feedback(tg_id: int, category: str, content_type: str, text: str = None, file_id: str = None,
+                        attachments: list = None):
+    # MinHash считаем в потоке и до транзакции: это десятки мс чистого Python
+    sig = await asyncio.to_thread(signature, text) if text else None
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.telegram_id == tg_id))
         if user:
-            session.add(Feedback(
+            feedback = Feedback(
                 user_id=user.id,
                 category=category,
                 content_type=content_type,
                 text=text,
                 file_id=file_id
-            ))
+            )
+            session.add(feedback)
+            await session.flush()
+            _add_attachments(session, 'feedback', feedback.id, attachments)
+            # Ищем похожие и кладём в кластер в той же транзакции
+            if sig is not None:
+                await session.run_sync(lambda s: assign_cluster(s.connection(), feedback.id, category, sig))
+            await _bump(session, 'feedback')
+            await _bump(session, f'feedback:{category}')
+            info = _item_info(feedback, user)
             await session.commit()
+            bump_version('feedback')
+            _new_item('feedback', info)
 
-async def save_report(tg_id: int, content_type: str, text: str = None, file_id: str = None):
+async def save_report(tg_id: int, content_type: str, text: str = None, file_id: str = None,
+                      attachments: list = None):
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.telegram_id == tg_id))
         if user:
-            session.add(Report(
+            report = Report(
                 user_id=user.id,
                 content_type=content_type,
                 text=text,
                 file_id=file_id
-            ))
+            )
+            session.add(report)
+            await session.flush()
+            _add_attachments(session, 'report', report.id, attachments)
+            await _bump(session, 'report')
+            info = _item_info(report, user)
             await session.commit()
+            bump_version('report')
+            _new_item('report', info)
 
-async def get_items_paginated(item_type: str, page: int = 1, limit: int = 10):
-    """Универсальная функция для получения фидбека или репортов"""
-    offset = (page - 1) * limit
+async def get_items_paginated(item_type: str, limit: int = 10, direction: str = None, cursor_id: int = None):
+    """Универсальная функция для получения фидбека или репортов.
+    Возвращает (items, total, has_prev, has_next)"""
     Model = Feedback if item_type == 'feedback' else Report
     
-    async with async_session() as session:
+    async with read_session() as session:
         # Получаем данные вместе с пользователем (joinedload)
-        stmt = select(Model).options(joinedload(Model.user)).order_by(desc(Model.created_at)).offset(offset).limit(limit)
-        result = await session.scalars(stmt)
-        
-        # Считаем общее кол-во
-        total = await session.scalar(select(func.count()).select_from(Model))
-        
-        return result.all(), total
+        stmt = select(Model).options(joinedload(Model.user))
+        if Model is Feedback:
+            # Кластер похожих — одной строкой (его самое свежее обращение)
+            stmt = stmt.options(joinedload(Feedback.cluster)).where(Feedback.cluster_head == True)
+        items, has_prev, has_next = await _keyset_page(session, stmt, Model, 'created_at', limit, direction, cursor_id)
+
+        total = await _get_counter(session, item_type)
+        return items, total, has_prev, has_next
 
 async def get_item_by_id(item_type: str, item_id: int):
     Model = Feedback if item_type == 'feedback' else Report
-    async with async_session() as session:
+    async with read_session() as session:
         stmt = select(Model).options(joinedload(Model.user)).where(Model.id == item_id)
+        if Model is Feedback:
+            stmt = stmt.options(joinedload(Feedback.cluster))
         return await session.scalar(stmt)
     
+async def get_attachments(item_type: str, item_id: int) -> list:
+    """Вложения записи по порядку: [(content_type, file_id), ...]"""
+    async with read_session() as session:
+        result = await session.execute(
+            select(Attachment.content_type, Attachment.file_id)
+            .where(Attachment.owner_type == item_type, Attachment.owner_id == item_id)
+            .order_by(Attachment.position)
+        )
+        return [tuple(row) for row in result.all()]
+
 async def get_user_by_telegram_id(telegram_id: int):
     """Получает пользователя по telegram_id"""
-    async with async_session() as session:
+    async with read_session() as session:
         result = await session.execute(
             select(User).where(User.telegram_id == telegram_id)
         )
-        return result.scalar_one_or_none()
\ No newline at end of file
+        return result.scalar_one_or_none()
+
+# --- Поиск ---
+# Маркеры подсветки в сниппетах: управляющие символы, которых не бывает в тексте.
+# После html-экранирования их заменяют на теги (см. handlers/admin.py)
+SNIPPET_OPEN, SNIPPET_CLOSE = '\x02', '\x03'
+SEARCH_MAX_TERMS = 8
+
+def build_search_query(query: str):
+    """Превращает ввод админа в безопасный запрос FTS5: все слова, каждое по префиксу.
+    Операторы FTS5 из ввода не проходят. Вернёт None, если слов нет"""
+    words = re.findall(r'\w+', query)[:SEARCH_MAX_TERMS]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+async def search_items(item_type: str, query: str, limit: int = 10, offset: int = 0):
+    """Ранжированный (bm25) поиск по тексту. Возвращает (rows, has_next);
+    у строки есть id, snippet, full_name, username"""
+    match = build_search_query(query)
+    if match is None:
+        return [], False
+
+    table, fts = item_type, FTS_TABLES[item_type]
+    stmt = text(
+        f"SELECT t.id, snippet({fts}, 0, :open, :close, '…', 12) AS snippet, u.full_name, u.username "
+        f"FROM {fts} JOIN {table} t ON t.id = {fts}.rowid JOIN users u ON u.id = t.user_id "
+        f"WHERE {fts} MATCH :match ORDER BY {fts}.rank LIMIT :limit OFFSET :offset"
+    )
+    async with read_session() as session:
+        result = await session.execute(stmt, {
+            "open": SNIPPET_OPEN, "close": SNIPPET_CLOSE, "match": match,
+            "limit": limit + 1, "offset": offset,
+        })
+        rows = result.all()
+    return rows[:limit], len(rows) > limit
+
+async def rebuild_search():
+    """Перестраивает FTS-индексы (офлайн, см. manage.py rebuild-fts)"""
+    async with engine.begin() as conn:
+        await conn.run_sync(rebuild_search_index)
+
+async def recluster_feedback():
+    """Пересобирает кластеры похожего фидбека (офлайн, см. manage.py rebuild-clusters)"""
+    async with engine.begin() as conn:
+        await conn.run_sync(rebuild_clusters)
+    bump_version('feedback')
+
+async def get_cluster_items(cluster_id: int, limit: int, offset: int = 0):
+    """Обращения одного кластера, новые сверху. Возвращает (items, has_next)"""
+    async with read_session() as session:
+        result = await session.scalars(
+            select(Feedback).options(joinedload(Feedback.user))
+            .where(Feedback.cluster_id == cluster_id)
+            .order_by(desc(Feedback.id))
+            .limit(limit + 1).offset(offset)
+        )
+        items = result.all()
+    return items[:limit], len(items) > limit
+
+# --- Рассылки ---
+async def create_broadcast(admin_chat_id: int, message_id: int) -> Broadcast:
+    counters = await get_counters('users', 'users:banned')
+    async with async_session() as session:
+        broadcast = Broadcast(
+            admin_chat_id=admin_chat_id,
+            message_id=message_id,
+            total=counters['users'] - counters['users:banned'],
+        )
+        session.add(broadcast)
+        await session.commit()
+        await session.refresh(broadcast)
+        return broadcast
+
+async def get_broadcast(broadcast_id: int):
+    async with read_session() as session:
+        return await session.get(Broadcast, broadcast_id)
+
+async def get_running_broadcasts():
+    async with read_session() as session:
+        result = await session.scalars(select(Broadcast).where(Broadcast.status == 'running'))
+        return result.all()
+
+async def save_broadcast_progress(broadcast_id: int, last_user_id: int, sent: int, failed: int, status: str = None) -> str:
+    """Сохраняет прогресс и возвращает статус из БД (его мог сменить cancel_broadcast из другого процесса)"""
+    async with async_session() as session:
+        await session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id)
+            .values(last_user_id=last_user_id, sent=sent, failed=failed)
+        )
+        if status:
+            # Итоговый статус — только идущей рассылке, чтобы не перетереть отмену из другого процесса
+            await session.execute(
+                update(Broadcast).where(Broadcast.id == broadcast_id, Broadcast.status == 'running')
+                .values(status=status, finished_at=func.now())
+            )
+        stored = await session.scalar(select(Broadcast.status).where(Broadcast.id == broadcast_id))
+        await session.commit()
+        return stored
+
+async def cancel_broadcast(broadcast_id: int) -> bool:
+    """Помечает идущую рассылку отменённой; её процесс увидит это при следующем сохранении прогресса"""
+    async with async_session() as session:
+        result = await session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == 'running')
+            .values(status='cancelled', finished_at=func.now())
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+async def stream_broadcast_recipients(after_user_id: int = 0, chunk_size: int = 1000):
+    """Отдаёт (users.id, telegram_id) незабаненных по возрастанию id.
+
+    Читаем потоковым курсором, но порциями: держать одну транзакцию открытой
+    всю рассылку (часы) нельзя — WAL не сможет сделать checkpoint.
+    """
+    while True:
+        stmt = (
+            select(User.id, User.telegram_id)
+            .where(User.id > after_user_id, or_(User.banned == False, User.banned.is_(None)))
+            .order_by(User.id)
+            .limit(chunk_size)
+        )
+        rows = 0
+        async with read_session() as session:
+            result = await session.stream(stmt.execution_options(yield_per=200))
+            async for user_id, telegram_id in result:
+                rows += 1
+                after_user_id = user_id
+                yield user_id, telegram_id
+        if rows < chunk_size:
+            return
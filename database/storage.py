@@ -0,0 +1,168 @@
+import asyncio
+import copy
+import json
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.models import FsmRecord
+from database.requests import async_session
+from utils.cache import LRUCache
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в SQLite с LRU-кэшем в памяти.
+
+    Читаем из памяти, в БД ходим только при промахе. Изменения копятся
+    flush_delay секунд и уходят одной транзакцией, так что несколько
+    update_data/set_state подряд дают одну запись. Если запись не удалась
+    (например, database is locked), изменения остаются в памяти и через
+    retry_delay секунд пробуем снова. Состояния, которые не менялись дольше
+    idle_ttl, считаются протухшими и удаляются.
+    """
+
+    def __init__(self, maxsize: int = 10000, idle_ttl: float = 3 * 24 * 3600, flush_delay: float = 0.5,
+                 retry_delay: float = 5.0):
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.idle_ttl = idle_ttl
+        self.flush_delay = flush_delay
+        self.retry_delay = retry_delay
+        # key -> {"state": str | None, "data": dict}
+        self._cache = LRUCache(maxsize=maxsize, ttl=idle_ttl)
+        # Ещё не записанные в БД; держим отдельно, чтобы LRU не выкинул их до записи
+        self._dirty: Dict[str, dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # --- Память ---
+    async def _get_entry(self, key: StorageKey) -> dict:
+        db_key = self.key_builder.build(key)
+        entry = self._dirty.get(db_key) or self._cache.get(db_key)
+        if entry is not None:
+            return entry
+
+        cutoff = func.datetime('now', f'-{int(self.idle_ttl)} seconds')
+        async with async_session() as session:
+            row = (await session.execute(
+                select(FsmRecord.state, FsmRecord.data)
+                .where(FsmRecord.key == db_key, FsmRecord.updated_at >= cutoff)
+            )).first()
+
+        # Пока ждали БД, запись могла появиться из параллельного апдейта
+        entry = self._dirty.get(db_key) or self._cache.get(db_key)
+        if entry is None:
+            entry = {"state": row.state, "data": json.loads(row.data)} if row else {"state": None, "data": {}}
+            self._cache.set(db_key, entry)
+        return entry
+
+    def _mark_dirty(self, key: StorageKey, entry: dict):
+        db_key = self.key_builder.build(key)
+        self._cache.set(db_key, entry)  # заодно продлеваем TTL
+        self._dirty[db_key] = entry
+        self._schedule_flush(self.flush_delay)
+
+    # --- BaseStorage ---
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._get_entry(key)
+        entry["state"] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_entry(key))["state"]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        entry = await self._get_entry(key)
+        entry["data"] = copy.deepcopy(data)
+        self._mark_dirty(key, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._get_entry(key))["data"])
+
+    async def close(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+    def state_counts(self) -> Dict[Optional[str], int]:
+        """Сколько ключей в памяти в каждом состоянии (для метрик)"""
+        counts: Dict[Optional[str], int] = {}
+        entries = {id(entry): entry for entry in self._cache.values()}
+        entries.update((id(entry), entry) for entry in self._dirty.values())
+        for entry in entries.values():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
+
+    @property
+    def cache(self) -> LRUCache:
+        """Память FSM (для метрик: размер и доля попаданий)"""
+        return self._cache
+
+    def dirty_count(self) -> int:
+        """Сколько изменений ещё не записано в БД (для метрик)"""
+        return len(self._dirty)
+
+    # --- Запись в БД ---
+    def _schedule_flush(self, delay: float):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush(delay))
+            self._flush_task.add_done_callback(self._flush_done)
+
+    async def _delayed_flush(self, delay: float):
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    def _flush_done(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        # flush() уже вернул изменения в _dirty — повторяем позже
+        print(f"FSM storage: flush failed ({task.exception()}), retrying in {self.retry_delay}s")
+        if self._dirty:
+            self._schedule_flush(self.retry_delay)
+
+    async def flush(self):
+        """Пишет все накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+
+        rows, empty_keys = [], []
+        for db_key, entry in dirty.items():
+            if entry["state"] is None and not entry["data"]:
+                empty_keys.append(db_key)
+            else:
+                rows.append({
+                    "key": db_key,
+                    "state": entry["state"],
+                    "data": json.dumps(entry["data"], ensure_ascii=False),
+                })
+
+        try:
+            async with async_session() as session:
+                if rows:
+                    stmt = sqlite_insert(FsmRecord).values(rows)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[FsmRecord.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": func.now()},
+                    )
+                    await session.execute(stmt)
+                if empty_keys:
+                    await session.execute(delete(FsmRecord).where(FsmRecord.key.in_(empty_keys)))
+                await session.commit()
+        except Exception:
+            # Не потеряем изменения: вернём их в очередь (новые записи приоритетнее)
+            self._dirty = {**dirty, **self._dirty}
+            raise
+
+    async def purge_expired(self) -> int:
+        """Удаляет из БД состояния, которые не трогали дольше idle_ttl"""
+        cutoff = func.datetime('now', f'-{int(self.idle_ttl)} seconds')
+        async with async_session() as session:
+            result = await session.execute(delete(FsmRecord).where(FsmRecord.updated_at < cutoff))
+            await session.commit()
+        return result.rowcount
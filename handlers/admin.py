@@ -1,43 +1,70 @@
+import asyncio
+import html
 import math
+import re
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import (
+    Message, CallbackQuery, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+)
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from database.requests import (
     is_admin, get_items_paginated, get_item_by_id, 
-    get_users_paginated, toggle_ban_status, get_user_by_telegram_id
+    get_users_paginated, toggle_ban_status, get_user_by_telegram_id, get_counters,
+    create_broadcast, get_broadcast, get_running_broadcasts, data_versions,
+    search_items, build_search_query, SNIPPET_OPEN, SNIPPET_CLOSE, get_attachments, get_cluster_items
 )
 from utils.states import AdminStates
+from utils.broadcast import broadcaster, format_progress, progress_keyboard, stats_from_db
+from utils.cleanup import cleaner
+from utils.cache import SingleFlightCache
+from utils.navigation import (
+    navigation, screen_token, ListCb, ItemCb, ProfileCb, BanCb, DmCb, ReplyCb, SearchCb, SearchPageCb, ClusterCb,
+    BroadcastCb,
+)
 from handlers.user import get_main_menu_keyboard
 
 admin_router = Router()
 
 ITEMS_PER_PAGE = 5
 
+# Токен страницы в callback_data: "<номер>[<направление><id курсора>]", например "3a1234".
+# a — после курсора (вперёд), b — до курсора (назад), f — с курсора включительно (возврат к странице)
+PAGE_TOKEN_RE = re.compile(r"^(\d+)(?:([abf])(\d+))?$")
+PAGE_DIRECTIONS = {"a": "after", "b": "before", "f": "from"}
+
+# Данные профиля из Telegram: переходы профиль ↔ бан ↔ карточка не дёргают API заново
+PROFILE_INFO_TTL = 300
+profile_info_cache = SingleFlightCache(maxsize=1000, ttl=PROFILE_INFO_TTL)
+
+# Готовые (text, markup) страниц списков. В ключе — версии данных, от которых
+# зависит страница, так что после изменений старые записи просто перестают находиться
+render_cache = SingleFlightCache(maxsize=500)
+LIST_DEPENDENCIES = {
+    "feedback": ("feedback", "users"),
+    "report": ("report", "users"),
+    "users": ("users",),
+    "banned": ("users",),
+}
+USER_LISTS = {"users", "banned"}
+
 
 # === HELPER ФУНКЦИИ ===
 async def cleanup_extra_messages(state: FSMContext, bot: Bot, chat_id: int):
-    """Удаляет сохраненные в состоянии сообщения (например, стикеры, аватарки)"""
+    """Удаляет сохраненные в состоянии сообщения (например, стикеры, аватарки).
+    Само удаление идёт в фоне пачкой, следующий экран не ждёт"""
     data = await state.get_data()
-    extra_msg_ids = data.get("extra_msg_ids", [])
-    
-    for msg_id in extra_msg_ids:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=msg_id)
-        except Exception:
-            pass
+    msg_ids = list(data.get("extra_msg_ids") or [])
     
     # Старый формат для совместимости
-    extra_msg_id = data.get("extra_msg_id")
-    if extra_msg_id:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=extra_msg_id)
-        except Exception:
-            pass
+    if data.get("extra_msg_id"):
+        msg_ids.append(data["extra_msg_id"])
     
-    await state.update_data(extra_msg_id=None, extra_msg_ids=[])
+    if msg_ids:
+        cleaner.schedule(bot, chat_id, msg_ids)
+        await state.update_data(extra_msg_id=None, extra_msg_ids=[])
 
 
 async def safe_edit_or_send(callback: CallbackQuery, text: str, reply_markup=None, parse_mode="HTML"):
@@ -54,10 +81,21 @@ async def safe_edit_or_send(callback: CallbackQuery, text: str, reply_markup=Non
 
 
 async def get_user_profile_info(bot: Bot, telegram_id: int) -> dict:
-    """Получает информацию о пользователе из Telegram API"""
+    """Получает информацию о пользователе из Telegram API (с кэшем).
+    Ошибки не кэшируем, чтобы следующий заход попробовал снова"""
+    return await profile_info_cache.get_or_fetch(
+        telegram_id,
+        lambda: _fetch_user_profile_info(bot, telegram_id),
+        should_cache=lambda info: "error" not in info,
+    )
+
+
+async def _fetch_user_profile_info(bot: Bot, telegram_id: int) -> dict:
     try:
-        chat = await bot.get_chat(telegram_id)
-        photos = await bot.get_user_profile_photos(telegram_id, limit=1)
+        chat, photos = await asyncio.gather(
+            bot.get_chat(telegram_id),
+            bot.get_user_profile_photos(telegram_id, limit=1),
+        )
         
         return {
             "id": chat.id,
@@ -72,6 +110,59 @@ async def get_user_profile_info(bot: Bot, telegram_id: int) -> dict:
         return {"error": str(e)}
 
 
+async def render_list_page(user_id: int, list_type: str, token: str, render) -> tuple:
+    """Отдаёт отрисованную страницу списка из кэша или рисует её через render(list_type, token).
+    Страница общая для всех админов, поэтому её экран для кнопок «назад» запоминаем за текущим"""
+    versions = tuple(data_versions[name] for name in LIST_DEPENDENCIES[list_type])
+    text, markup, here = await render_cache.get_or_fetch((list_type, token, versions), lambda: render(list_type, token))
+    if here:
+        navigation.remember(user_id, here)
+    return text, markup
+
+
+async def open_screen(callback: CallbackQuery, state: FSMContext, bot: Bot, packed: str):
+    """Перерисовывает экран по его callback_data (возврат после действия, например бана)"""
+    prefix = packed.split(":", 1)[0]
+    if prefix == ItemCb.__prefix__:
+        await view_item(callback, ItemCb.unpack(packed), state)
+    elif prefix == ProfileCb.__prefix__:
+        await view_profile(callback, ProfileCb.unpack(packed), state, bot)
+    elif prefix == ListCb.__prefix__:
+        callback_data = ListCb.unpack(packed)
+        if callback_data.list_type in USER_LISTS:
+            await list_users(callback, callback_data, state, bot)
+        else:
+            await list_items(callback, callback_data, state, bot)
+    else:
+        await go_home(callback, state, bot)
+
+
+ALBUM_MEDIA = {
+    "photo": InputMediaPhoto, "video": InputMediaVideo,
+    "document": InputMediaDocument, "audio": InputMediaAudio,
+}
+
+
+def build_album(attachments: list) -> list:
+    """[(content_type, file_id), ...] -> список InputMedia для send_media_group"""
+    return [
+        ALBUM_MEDIA[content_type](media=file_id)
+        for content_type, file_id in attachments
+        if content_type in ALBUM_MEDIA
+    ]
+
+
+def parse_page_token(token: str) -> tuple:
+    """Разбирает токен страницы в (page, direction, cursor_id)"""
+    match = PAGE_TOKEN_RE.match(token)
+    if not match:
+        return 1, None, None
+    page, direction, cursor_id = match.groups()
+    if direction is None:
+        return int(page), None, None
+    return int(page), PAGE_DIRECTIONS[direction], int(cursor_id)
+
+
 # === ГЛАВНОЕ МЕНЮ (ИЗМЕНЕНО) ===
 # Теперь ловим Callback, а не команду /admin
 @admin_router.callback_query(F.data == "open_admin_panel")
@@ -84,13 +175,14 @@ async def admin_panel(callback: CallbackQuery, state: FSMContext, bot: Bot):
     await cleanup_extra_messages(state, bot, callback.message.chat.id)
     
     kb = InlineKeyboardBuilder()
-    kb.button(text="📩 Фидбек", callback_data="menu_feedback_1")
-    kb.button(text="⛔ Жалобы", callback_data="menu_report_1")
-    kb.button(text="👥 Пользователи", callback_data="menu_users_1")
-    kb.button(text="☠ Бан-лист", callback_data="menu_banned_1")
+    kb.button(text="📩 Фидбек", callback_data=ListCb(list_type="feedback", page="1"))
+    kb.button(text="⛔ Жалобы", callback_data=ListCb(list_type="report", page="1"))
+    kb.button(text="👥 Пользователи", callback_data=ListCb(list_type="users", page="1"))
+    kb.button(text="☠ Бан-лист", callback_data=ListCb(list_type="banned", page="1"))
+    kb.button(text="📢 Рассылка", callback_data="broadcast_menu")
     # Можно добавить кнопку закрытия админки
     kb.button(text="❌ Закрыть", callback_data="close_admin") 
-    kb.adjust(2, 2, 1)
+    kb.adjust(2, 2, 1, 1)
     
     # Используем edit_text через safe helper
     await safe_edit_or_send(callback, "👮‍♂️ <b>Панель администратора</b>", reply_markup=kb.as_markup())
@@ -115,37 +207,55 @@ async def go_home(callback: CallbackQuery, state: FSMContext, bot: Bot):
     await state.clear()
     
     kb = InlineKeyboardBuilder()
-    kb.button(text="📩 Фидбек", callback_data="menu_feedback_1")
-    kb.button(text="⛔ Жалобы", callback_data="menu_report_1")
-    kb.button(text="👥 Пользователи", callback_data="menu_users_1")
-    kb.button(text="☠ Бан-лист", callback_data="menu_banned_1")
+    kb.button(text="📩 Фидбек", callback_data=ListCb(list_type="feedback", page="1"))
+    kb.button(text="⛔ Жалобы", callback_data=ListCb(list_type="report", page="1"))
+    kb.button(text="👥 Пользователи", callback_data=ListCb(list_type="users", page="1"))
+    kb.button(text="☠ Бан-лист", callback_data=ListCb(list_type="banned", page="1"))
+    kb.button(text="📢 Рассылка", callback_data="broadcast_menu")
     kb.button(text="❌ Закрыть", callback_data="close_admin")
-    kb.adjust(2, 2, 1)
+    kb.adjust(2, 2, 1, 1)
     
     await safe_edit_or_send(callback, "👮‍♂️ <b>Панель администратора</b>", reply_markup=kb.as_markup())
 
 
 # === СПИСКИ ФИДБЕКА И ЖАЛОБ ===
-@admin_router.callback_query(F.data.startswith("menu_feedback_") | F.data.startswith("menu_report_"))
-async def list_items(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@admin_router.callback_query(ListCb.filter(~F.list_type.in_(USER_LISTS)))
+async def list_items(callback: CallbackQuery, callback_data: ListCb, state: FSMContext, bot: Bot):
     await cleanup_extra_messages(state, bot, callback.message.chat.id)
 
-    parts = callback.data.split("_")
-    item_type = parts[1]
-    page = int(parts[2])
+    text, markup = await render_list_page(
+        callback.from_user.id, callback_data.list_type, callback_data.page, render_items_page
+    )
+    await safe_edit_or_send(callback, text, reply_markup=markup)
+
+
+def empty_list_page() -> tuple:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🔙 Назад", callback_data="home")
+    return "📭 Список пуст", kb.as_markup(), None
+
+
+async def render_items_page(item_type: str, token: str) -> tuple:
+    page, direction, cursor_id = parse_page_token(token)
     
-    items, total = await get_items_paginated(item_type, page, ITEMS_PER_PAGE)
-    total_pages = max(1, math.ceil(total / ITEMS_PER_PAGE))
+    items, total, has_prev, has_next = await get_items_paginated(item_type, ITEMS_PER_PAGE, direction, cursor_id)
+    if not has_prev:
+        page = 1
     
     if not items:
-        kb = InlineKeyboardBuilder()
-        kb.button(text="🔙 Назад", callback_data="home")
-        return await safe_edit_or_send(callback, "📭 Список пуст", reply_markup=kb.as_markup())
+        return empty_list_page()
     
     title = "📩 Фидбек" if item_type == "feedback" else "⛔ Жалобы"
-    text = f"<b>{title}</b>\n\n"
+    text = f"<b>{title}</b> ({total})\n"
+    if item_type == "feedback":
+        counters = await get_counters("feedback:idea", "feedback:bug", "feedback:review")
+        text += f"💡 {counters['feedback:idea']} · 📝 {counters['feedback:bug']} · ⭐ {counters['feedback:review']}\n"
+    text += "\n"
     
     kb = InlineKeyboardBuilder()
+    # Эта страница с курсора включительно: из карточки вернёмся ровно на неё
+    here = ListCb(list_type=item_type, page=f"{page}f{items[0].id}").pack()
+    back = screen_token(here)
     
     for item in items:
         if item_type == "feedback":
@@ -163,7 +273,7 @@ async def list_items(callback: CallbackQuery, state: FSMContext, bot: Bot):
         else:
             types_map = {
                 "photo": "Фото", "video": "Видео", "voice": "Голос",
-                "document": "Файл", "sticker": "Стикер"
+                "document": "Файл", "sticker": "Стикер", "album": "Альбом"
             }
             content_preview = f"[{types_map.get(item.content_type, 'Медиа')}]"
 
@@ -171,33 +281,40 @@ async def list_items(callback: CallbackQuery, state: FSMContext, bot: Bot):
         
         full_name = item.user.full_name or "Аноним"
         full_preview = (item.text[:50] + "...") if item.text else f"[{item.content_type}]"
+        
+        # Похожие обращения свёрнуты в одну строку — показываем, сколько их
+        cluster_size = item.cluster.size if item_type == "feedback" and item.cluster else 1
+        if cluster_size > 1:
+            btn_text = f"🔁{cluster_size} | {btn_text}"
+            full_name += f" · 🔁 ×{cluster_size}"
+        
         text += f"{icon} <b>#{item.id}</b> {full_name}\n└ {full_preview}\n\n"
         
-        kb.button(text=btn_text, callback_data=f"view_{item_type}_{item.id}_{page}")
+        kb.button(text=btn_text, callback_data=ItemCb(item_type=item_type, item_id=item.id, back=back))
     
     kb.adjust(1)
     
     nav_row = []
-    if page > 1:
-        nav_row.append(("⬅️", f"menu_{item_type}_{page-1}"))
-    if page < total_pages:
-        nav_row.append(("➡️", f"menu_{item_type}_{page+1}"))
+    if has_prev:
+        nav_row.append(("⬅️", ListCb(list_type=item_type, page=f"{page-1}b{items[0].id}")))
+    if has_next:
+        nav_row.append(("➡️", ListCb(list_type=item_type, page=f"{page+1}a{items[-1].id}")))
     
-    if nav_row:
-        for text_btn, data in nav_row:
-            kb.button(text=text_btn, callback_data=data)
-        kb.adjust(1, 1, 1, 1, 1, len(nav_row))
+    for text_btn, data in nav_row:
+        kb.button(text=text_btn, callback_data=data)
     
+    kb.button(text="🔍 Поиск", callback_data=SearchCb(item_type=item_type))
     kb.button(text="🔙 Назад", callback_data="home")
+    kb.adjust(*([1] * len(items)), *([len(nav_row)] if nav_row else []), 2)
     
-    await safe_edit_or_send(callback, text, reply_markup=kb.as_markup())
+    return text, kb.as_markup(), here
 
 
 # === ПРОСМОТР ОДНОЙ ЗАПИСИ ===
-@admin_router.callback_query(F.data.startswith("view_"))
-async def view_item(callback: CallbackQuery, state: FSMContext):
-    _, item_type, item_id, back_page = callback.data.split("_")
-    item = await get_item_by_id(item_type, int(item_id))
+@admin_router.callback_query(ItemCb.filter())
+async def view_item(callback: CallbackQuery, callback_data: ItemCb, state: FSMContext):
+    item_type = callback_data.item_type
+    item = await get_item_by_id(item_type, callback_data.item_id)
     
     if not item:
         return await callback.answer("❌ Не найдено", show_alert=True)
@@ -213,22 +330,46 @@ async def view_item(callback: CallbackQuery, state: FSMContext):
         f"📅 {item.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
         f"📝 {item.text or '—'}"
     )
+    if item_type == "feedback" and item.cluster and item.cluster.size > 1:
+        caption += f"\n\n🔁 <b>Похожих обращений:</b> {item.cluster.size - 1}"
+    
+    # Эта карточка — экран возврата для профиля и бана
+    here = navigation.remember(callback.from_user.id, callback_data.pack())
+    back_callback = navigation.resolve(
+        callback.from_user.id, callback_data.back, ListCb(list_type=item_type, page="1").pack()
+    )
     
     kb = InlineKeyboardBuilder()
-    kb.button(text="↩️ Ответить", callback_data=f"reply_{item.user.telegram_id}_{item.id}")
+    kb.button(text="↩️ Ответить", callback_data=ReplyCb(tg_id=item.user.telegram_id, item_id=item.id))
     
     ban_text = "🕊 Разбан" if item.user.banned else "🔨 Бан"
-    ban_action = "unban" if item.user.banned else "ban"
-    kb.button(text=ban_text, callback_data=f"{ban_action}_{item.user.telegram_id}_view_{item_type}_{item_id}_{back_page}")
+    kb.button(text=ban_text, callback_data=BanCb(tg_id=item.user.telegram_id, ban=not item.user.banned, back=here))
     
     # Кнопка профиля пользователя
-    kb.button(text="👤 Профиль", callback_data=f"profile_{item.user.telegram_id}_view_{item_type}_{item_id}_{back_page}")
-    
-    kb.button(text="🔙 К списку", callback_data=f"menu_{item_type}_{back_page}")
-    kb.adjust(2, 1, 1)
+    kb.button(text="👤 Профиль", callback_data=ProfileCb(tg_id=item.user.telegram_id, back=here))
+    
+    # Остальные обращения кластера в списке свёрнуты — открываем их отдельным экраном
+    has_cluster = item_type == "feedback" and item.cluster and item.cluster.size > 1
+    if has_cluster:
+        kb.button(
+            text=f"🔁 Похожие ({item.cluster.size})",
+            callback_data=ClusterCb(cluster_id=item.cluster_id, page=1, back=here),
+        )
+    
+    # Пришли из результатов поиска или из списка
+    if back_callback.startswith(SearchPageCb.__prefix__ + ":"):
+        kb.button(text="🔙 К результатам", callback_data=back_callback)
+    else:
+        kb.button(text="🔙 К списку", callback_data=back_callback)
+    kb.adjust(2, *([2] if has_cluster else [1]), 1)
     
     try:
-        if item.content_type == "photo":
+        if item.content_type == "album":
+            # Альбом — одним send_media_group; у альбома не бывает кнопок, поэтому карточка следом
+            album = await callback.message.answer_media_group(build_album(await get_attachments(item_type, item.id)))
+            await state.update_data(extra_msg_ids=[msg.message_id for msg in album])
+            await callback.message.answer(caption, reply_markup=kb.as_markup(), parse_mode="HTML")
+        elif item.content_type == "photo":
             await callback.message.answer_photo(item.file_id, caption=caption, reply_markup=kb.as_markup(), parse_mode="HTML")
         elif item.content_type == "video":
             await callback.message.answer_video(item.file_id, caption=caption, reply_markup=kb.as_markup(), parse_mode="HTML")
@@ -247,14 +388,52 @@ async def view_item(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer(f"⚠️ Ошибка контента: {e}\n\n{caption}", reply_markup=kb.as_markup(), parse_mode="HTML")
 
 
+# === ПОХОЖИЕ ОБРАЩЕНИЯ (КЛАСТЕР) ===
+@admin_router.callback_query(ClusterCb.filter())
+async def view_cluster(callback: CallbackQuery, callback_data: ClusterCb, state: FSMContext, bot: Bot):
+    await cleanup_extra_messages(state, bot, callback.message.chat.id)
+    
+    page = callback_data.page
+    items, has_next = await get_cluster_items(callback_data.cluster_id, ITEMS_PER_PAGE, (page - 1) * ITEMS_PER_PAGE)
+    back_callback = navigation.resolve(
+        callback.from_user.id, callback_data.back, ListCb(list_type="feedback", page="1").pack()
+    )
+    here = navigation.remember(callback.from_user.id, callback_data.pack())
+    
+    kb = InlineKeyboardBuilder()
+    text = f"🔁 <b>Похожие обращения</b> (стр. {page})\n\n"
+    icons = {"idea": "💡", "bug": "📝", "review": "⭐"}
+    for item in items:
+        name = html.escape(item.user.full_name or "Аноним")
+        preview = html.escape(item.text[:50] + "...") if item.text else f"[{item.content_type}]"
+        text += f"{icons.get(item.category, '❓')} <b>#{item.id}</b> {name}\n└ {preview}\n\n"
+        
+        user_display = f"@{item.user.username}" if item.user.username else (item.user.full_name or "Аноним")[:10]
+        kb.button(text=f"#{item.id} | {user_display}", callback_data=ItemCb(item_type="feedback", item_id=item.id, back=here))
+    
+    nav_row = []
+    if page > 1:
+        nav_row.append(("⬅️", ClusterCb(cluster_id=callback_data.cluster_id, page=page - 1, back=callback_data.back)))
+    if has_next:
+        nav_row.append(("➡️", ClusterCb(cluster_id=callback_data.cluster_id, page=page + 1, back=callback_data.back)))
+    for text_btn, data in nav_row:
+        kb.button(text=text_btn, callback_data=data)
+    
+    kb.button(text="🔙 Назад", callback_data=back_callback)
+    kb.adjust(*([1] * len(items)), *([len(nav_row)] if nav_row else []), 1)
+    
+    await safe_edit_or_send(callback, text, reply_markup=kb.as_markup())
+    await callback.answer()
+
+
 # === ПРОФИЛЬ ПОЛЬЗОВАТЕЛЯ ===
-@admin_router.callback_query(F.data.startswith("profile_"))
-async def view_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@admin_router.callback_query(ProfileCb.filter())
+async def view_profile(callback: CallbackQuery, callback_data: ProfileCb, state: FSMContext, bot: Bot):
     await cleanup_extra_messages(state, bot, callback.message.chat.id)
     
-    parts = callback.data.split("_")
-    telegram_id = int(parts[1])
-    back_callback = "_".join(parts[2:])  # Куда вернуться
+    telegram_id = callback_data.tg_id
+    here = navigation.remember(callback.from_user.id, callback_data.pack())
+    back_callback = navigation.resolve(callback.from_user.id, callback_data.back, "home")  # Куда вернуться
     
     # Получаем данные из БД
     db_user = await get_user_by_telegram_id(telegram_id)
@@ -317,14 +496,14 @@ async def view_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
     kb.button(text="💬 Открыть в Telegram", url=f"tg://user?id={telegram_id}")
     
     # Написать напрямую
-    kb.button(text="✉️ Написать", callback_data=f"dm_{telegram_id}_{back_callback}")
+    kb.button(text="✉️ Написать", callback_data=DmCb(tg_id=telegram_id, back=callback_data.back))
     
     # Бан/разбан
     if db_user:
         if db_user.banned:
-            kb.button(text="🕊 Разбанить", callback_data=f"unban_{telegram_id}_profile_{telegram_id}_{back_callback}")
+            kb.button(text="🕊 Разбанить", callback_data=BanCb(tg_id=telegram_id, ban=False, back=here))
         else:
-            kb.button(text="🔨 Забанить", callback_data=f"ban_{telegram_id}_profile_{telegram_id}_{back_callback}")
+            kb.button(text="🔨 Забанить", callback_data=BanCb(tg_id=telegram_id, ban=True, back=here))
     
     # Кнопка назад
     kb.button(text="🔙 Назад", callback_data=back_callback)
@@ -349,19 +528,17 @@ async def view_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
 
 
 # === НАПИСАТЬ ПОЛЬЗОВАТЕЛЮ НАПРЯМУЮ ===
-@admin_router.callback_query(F.data.startswith("dm_"))
-async def start_dm(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@admin_router.callback_query(DmCb.filter())
+async def start_dm(callback: CallbackQuery, callback_data: DmCb, state: FSMContext, bot: Bot):
     await cleanup_extra_messages(state, bot, callback.message.chat.id)
     
-    parts = callback.data.split("_")
-    tg_id = int(parts[1])
-    back_callback = "_".join(parts[2:])
+    tg_id = callback_data.tg_id
     
-    await state.update_data(target_id=tg_id, back_callback=back_callback, dm_mode=True)
+    await state.update_data(target_id=tg_id, dm_mode=True)
     await state.set_state(AdminStates.replying)
     
     kb = InlineKeyboardBuilder()
-    kb.button(text="❌ Отмена", callback_data=f"profile_{tg_id}_{back_callback}")
+    kb.button(text="❌ Отмена", callback_data=ProfileCb(tg_id=tg_id, back=callback_data.back))
     
     await safe_edit_or_send(
         callback,
@@ -374,12 +551,12 @@ async def start_dm(callback: CallbackQuery, state: FSMContext, bot: Bot):
 
 
 # === ОТВЕТ ПОЛЬЗОВАТЕЛЮ ===
-@admin_router.callback_query(F.data.startswith("reply_"))
-async def start_reply(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@admin_router.callback_query(ReplyCb.filter())
+async def start_reply(callback: CallbackQuery, callback_data: ReplyCb, state: FSMContext, bot: Bot):
     await cleanup_extra_messages(state, bot, callback.message.chat.id)
 
-    _, tg_id, item_id = callback.data.split("_")
-    await state.update_data(target_id=int(tg_id), item_id=item_id, dm_mode=False)
+    item_id = callback_data.item_id
+    await state.update_data(target_id=callback_data.tg_id, item_id=item_id, dm_mode=False)
     await state.set_state(AdminStates.replying)
     
     kb = InlineKeyboardBuilder()
@@ -418,27 +595,34 @@ async def send_reply(message: Message, state: FSMContext, bot: Bot):
 
 
 # === СПИСОК ПОЛЬЗОВАТЕЛЕЙ (ОБНОВЛЁННЫЙ) ===
-@admin_router.callback_query(F.data.startswith("menu_users_") | F.data.startswith("menu_banned_"))
-async def list_users(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@admin_router.callback_query(ListCb.filter(F.list_type.in_(USER_LISTS)))
+async def list_users(callback: CallbackQuery, callback_data: ListCb, state: FSMContext, bot: Bot):
     await cleanup_extra_messages(state, bot, callback.message.chat.id)
     
-    parts = callback.data.split("_")
-    mode = parts[1]  # users или banned
-    page = int(parts[2])
+    text, markup = await render_list_page(
+        callback.from_user.id, callback_data.list_type, callback_data.page, render_users_page  # users или banned
+    )
+    await safe_edit_or_send(callback, text, reply_markup=markup)
+
+
+async def render_users_page(mode: str, token: str) -> tuple:
+    page, direction, cursor_id = parse_page_token(token)
     
     only_banned = (mode == "banned")
-    users, total = await get_users_paginated(page, ITEMS_PER_PAGE, only_banned)
-    total_pages = max(1, math.ceil(total / ITEMS_PER_PAGE))
+    users, total, has_prev, has_next = await get_users_paginated(ITEMS_PER_PAGE, only_banned, direction, cursor_id)
+    if not has_prev:
+        page = 1
+    total_pages = max(page, math.ceil(total / ITEMS_PER_PAGE))
     
     if not users:
-        kb = InlineKeyboardBuilder()
-        kb.button(text="🔙 Назад", callback_data="home")
-        return await safe_edit_or_send(callback, "📭 Список пуст", reply_markup=kb.as_markup())
+        return empty_list_page()
     
     title = "☠ Бан-лист" if only_banned else "👥 Пользователи"
     text = f"<b>{title}</b> (стр. {page}/{total_pages})\n\n"
     
     kb = InlineKeyboardBuilder()
+    here = ListCb(list_type=mode, page=f"{page}f{users[0].id}").pack()
+    back = screen_token(here)
     
     for user in users:
         status = "☠" if user.banned else "🟢"
@@ -451,16 +635,16 @@ async def list_users(callback: CallbackQuery, state: FSMContext, bot: Bot):
         
         # Кнопка — открывает профиль
         btn_text = f"👤 {name[:12]} ({username[:10] if user.username else 'нет @'})"
-        kb.button(text=btn_text, callback_data=f"profile_{user.telegram_id}_menu_{mode}_{page}")
+        kb.button(text=btn_text, callback_data=ProfileCb(tg_id=user.telegram_id, back=back))
     
     kb.adjust(1)  # Кнопки по одной в ряд для читаемости
     
     # Навигация
     nav_buttons = []
-    if page > 1:
-        nav_buttons.append(("⬅️", f"menu_{mode}_{page-1}"))
-    if page < total_pages:
-        nav_buttons.append(("➡️", f"menu_{mode}_{page+1}"))
+    if has_prev:
+        nav_buttons.append(("⬅️", ListCb(list_type=mode, page=f"{page-1}b{users[0].id}")))
+    if has_next:
+        nav_buttons.append(("➡️", ListCb(list_type=mode, page=f"{page+1}a{users[-1].id}")))
     
     for text_btn, data in nav_buttons:
         kb.button(text=text_btn, callback_data=data)
@@ -470,18 +654,14 @@ async def list_users(callback: CallbackQuery, state: FSMContext, bot: Bot):
     
     kb.button(text="🔙 Назад", callback_data="home")
     
-    await safe_edit_or_send(callback, text, reply_markup=kb.as_markup())
+    return text, kb.as_markup(), here
 
 
 # === БАН/РАЗБАН ===
-@admin_router.callback_query(F.data.startswith("ban_") | F.data.startswith("unban_"))
-async def toggle_ban(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    parts = callback.data.split("_")
-    action = parts[0]
-    tg_id = int(parts[1])
-    back_callback = "_".join(parts[2:])
-    
-    should_ban = (action == "ban")
+@admin_router.callback_query(BanCb.filter())
+async def toggle_ban(callback: CallbackQuery, callback_data: BanCb, state: FSMContext, bot: Bot):
+    tg_id = callback_data.tg_id
+    should_ban = callback_data.ban
     
     if should_ban and await is_admin(tg_id):
         return await callback.answer("❌ Нельзя забанить админа", show_alert=True)
@@ -490,19 +670,214 @@ async def toggle_ban(callback: CallbackQuery, state: FSMContext, bot: Bot):
     status = "забанен ☠" if should_ban else "разбанен 🕊"
     await callback.answer(f"Пользователь {status}")
     
-    # Устанавливаем callback для возврата
-    callback.data = back_callback
-    
-    # Определяем куда вернуться
-    if back_callback.startswith("view_"):
-        await view_item(callback, state)
-    elif back_callback.startswith("profile_"):
-        await view_profile(callback, state, bot)
-    elif back_callback.startswith("menu_"):
-        if "users" in back_callback or "banned" in back_callback:
-            await list_users(callback, state, bot)
-        else:
-            await list_items(callback, state, bot)
+    # Перерисовываем экран, с которого банили
+    await open_screen(callback, state, bot, navigation.resolve(callback.from_user.id, callback_data.back, "home"))
+
+
+# === ПОИСК ===
+SEARCH_TITLES = {"feedback": "фидбеку", "report": "жалобам"}
+
+
+def format_snippet(snippet: str) -> str:
+    """Экранирует сниппет и превращает маркеры совпадений в жирный шрифт"""
+    snippet = html.escape(snippet.replace("\n", " "))
+    return snippet.replace(SNIPPET_OPEN, "<b>").replace(SNIPPET_CLOSE, "</b>")
+
+
+async def render_search_page(user_id: int, item_type: str, query: str, page: int) -> tuple:
+    rows, has_next = await search_items(item_type, query, ITEMS_PER_PAGE, (page - 1) * ITEMS_PER_PAGE)
+    
+    kb = InlineKeyboardBuilder()
+    if not rows:
+        text = f"🔍 По запросу «{html.escape(query)}» ничего не найдено"
+        kb.button(text="🔍 Новый поиск", callback_data=SearchCb(item_type=item_type))
+        kb.button(text="🔙 К списку", callback_data=ListCb(list_type=item_type, page="1"))
+        kb.adjust(1)
+        return text, kb.as_markup()
+    
+    text = f"🔍 <b>Поиск по {SEARCH_TITLES[item_type]}:</b> «{html.escape(query)}» (стр. {page})\n\n"
+    query_token = navigation.remember(user_id, query)
+    back = navigation.remember(user_id, SearchPageCb(item_type=item_type, page=page, query=query_token).pack())
+    for row in rows:
+        name = html.escape(row.full_name or "Аноним")
+        text += f"<b>#{row.id}</b> {name}\n└ {format_snippet(row.snippet or '')}\n\n"
+        
+        user_display = f"@{row.username}" if row.username else (row.full_name or "Аноним")[:10]
+        kb.button(text=f"#{row.id} | {user_display}", callback_data=ItemCb(item_type=item_type, item_id=row.id, back=back))
+    
+    nav_row = []
+    if page > 1:
+        nav_row.append(("⬅️", SearchPageCb(item_type=item_type, page=page - 1, query=query_token)))
+    if has_next:
+        nav_row.append(("➡️", SearchPageCb(item_type=item_type, page=page + 1, query=query_token)))
+    for text_btn, data in nav_row:
+        kb.button(text=text_btn, callback_data=data)
+    
+    kb.button(text="🔍 Новый поиск", callback_data=SearchCb(item_type=item_type))
+    kb.button(text="🔙 К списку", callback_data=ListCb(list_type=item_type, page="1"))
+    kb.adjust(*([1] * len(rows)), *([len(nav_row)] if nav_row else []), 2)
+    
+    return text, kb.as_markup()
+
+
+@admin_router.callback_query(SearchCb.filter())
+async def search_start(callback: CallbackQuery, callback_data: SearchCb, state: FSMContext, bot: Bot):
+    if not await is_admin(callback.from_user.id):
+        return await callback.answer("⛔ Нет доступа.", show_alert=True)
+    
+    await cleanup_extra_messages(state, bot, callback.message.chat.id)
+    
+    item_type = callback_data.item_type
+    await state.set_state(AdminStates.search)
+    await state.update_data(search_type=item_type)
+    
+    kb = InlineKeyboardBuilder()
+    kb.button(text="❌ Отмена", callback_data="home")
+    
+    await safe_edit_or_send(
+        callback,
+        f"🔍 <b>Поиск по {SEARCH_TITLES[item_type]}</b>\n\n"
+        "Отправьте слова для поиска.\n"
+        "<i>Ищутся записи, где есть все слова (можно начало слова)</i>",
+        reply_markup=kb.as_markup()
+    )
+    await callback.answer()
+
+
+@admin_router.message(AdminStates.search)
+async def search_query(message: Message, state: FSMContext):
+    if not message.text or build_search_query(message.text) is None:
+        return await message.answer("⚠️ Отправьте текст со словами для поиска.")
+    
+    data = await state.get_data()
+    item_type = data.get("search_type", "feedback")
+    query = message.text[:200]
+    
+    # Сам запрос страницы результатов несут в себе (токен в navigation), состояние больше не нужно
+    await state.set_state(None)
+    
+    text, markup = await render_search_page(message.from_user.id, item_type, query, 1)
+    await message.answer(text, reply_markup=markup, parse_mode="HTML")
+
+
+@admin_router.callback_query(SearchPageCb.filter())
+async def search_results(callback: CallbackQuery, callback_data: SearchPageCb, state: FSMContext, bot: Bot):
+    await cleanup_extra_messages(state, bot, callback.message.chat.id)
+    
+    query = navigation.resolve(callback.from_user.id, callback_data.query)
+    if not query:
+        return await callback.answer("⌛ Поиск устарел, начните заново", show_alert=True)
+    
+    text, markup = await render_search_page(
+        callback.from_user.id, callback_data.item_type, query, callback_data.page
+    )
+    await safe_edit_or_send(callback, text, reply_markup=markup)
+    await callback.answer()
+
+
+# === РАССЫЛКА ===
+@admin_router.callback_query(F.data == "broadcast_menu")
+async def broadcast_menu(callback: CallbackQuery, state: FSMContext, bot: Bot):
+    if not await is_admin(callback.from_user.id):
+        return await callback.answer("⛔ Нет доступа.", show_alert=True)
+
+    await cleanup_extra_messages(state, bot, callback.message.chat.id)
+
+    # Уже идёт рассылка (здесь или в другом процессе) — показываем её прогресс
+    running = broadcaster.running() or [stats_from_db(broadcast) for broadcast in await get_running_broadcasts()]
+    if running:
+        await safe_edit_or_send(callback, format_progress(running[0]), reply_markup=progress_keyboard(running[0]))
+        return await callback.answer()
+
+    await state.set_state(AdminStates.broadcast)
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text="❌ Отмена", callback_data="home")
+
+    await safe_edit_or_send(
+        callback,
+        "📢 <b>Рассылка</b>\n\n"
+        "Отправьте сообщение, которое получат все пользователи (кроме забаненных).\n"
+        "<i>Текст, фото, видео — что угодно</i>",
+        reply_markup=kb.as_markup()
+    )
+    await callback.answer()
+
+
+@admin_router.message(AdminStates.broadcast)
+async def broadcast_preview(message: Message, state: FSMContext):
+    counters = await get_counters("users", "users:banned")
+    recipients = counters["users"] - counters["users:banned"]
+
+    await state.update_data(broadcast_message_id=message.message_id)
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text=f"✅ Отправить ({recipients})", callback_data="bc_confirm")
+    kb.button(text="❌ Отмена", callback_data="home")
+    kb.adjust(1)
+
+    await message.answer(
+        f"📢 Сообщение выше получат <b>{recipients}</b> пользователей. Отправляем?",
+        reply_markup=kb.as_markup(), parse_mode="HTML"
+    )
+
+
+@admin_router.callback_query(F.data == "bc_confirm")
+async def broadcast_confirm(callback: CallbackQuery, state: FSMContext, bot: Bot):
+    if not await is_admin(callback.from_user.id):
+        return await callback.answer("⛔ Нет доступа.", show_alert=True)
+
+    data = await state.get_data()
+    message_id = data.get("broadcast_message_id")
+    if not message_id:
+        return await callback.answer("❌ Сообщение для рассылки не найдено", show_alert=True)
+
+    # Пока админ готовил сообщение, рассылку мог запустить другой (в том числе в другом процессе)
+    if broadcaster.running() or await get_running_broadcasts():
+        return await callback.answer("⏳ Уже идёт другая рассылка", show_alert=True)
+
+    await state.clear()
+
+    broadcast = await create_broadcast(callback.message.chat.id, message_id)
+    broadcaster.start(bot, broadcast)
+
+    stats = broadcaster.stats[broadcast.id]
+    stats["progress_msg_id"] = callback.message.message_id
+    await safe_edit_or_send(callback, format_progress(stats), reply_markup=progress_keyboard(stats))
+    await callback.answer("Рассылка запущена")
+
+
+@admin_router.callback_query(BroadcastCb.filter(F.action == "status"))
+async def broadcast_status(callback: CallbackQuery, callback_data: BroadcastCb):
+    if not await is_admin(callback.from_user.id):
+        return await callback.answer("⛔ Нет доступа.", show_alert=True)
+
+    broadcast_id = callback_data.broadcast_id
+    stats = broadcaster.stats.get(broadcast_id)
+
+    if stats is None:
+        # Рассылка была до рестарта и уже закончилась — берём итог из БД
+        broadcast = await get_broadcast(broadcast_id)
+        if not broadcast:
+            return await callback.answer("❌ Не найдено", show_alert=True)
+        stats = stats_from_db(broadcast)
+
+    try:
+        await safe_edit_or_send(callback, format_progress(stats), reply_markup=progress_keyboard(stats))
+    except Exception:
+        pass  # Ничего не изменилось с прошлого обновления
+    await callback.answer()
+
+
+@admin_router.callback_query(BroadcastCb.filter(F.action == "stop"))
+async def broadcast_stop(callback: CallbackQuery, callback_data: BroadcastCb):
+    if not await is_admin(callback.from_user.id):
+        return await callback.answer("⛔ Нет доступа.", show_alert=True)
+
+    if await broadcaster.cancel(callback_data.broadcast_id):
+        await callback.answer("⏹ Останавливаем рассылку...")
+    else:
+        await callback.answer("Рассылка уже завершена", show_alert=True)
 
 
 @admin_router.callback_query(F.data == "ignore")
@@ -5,6 +5,8 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from database.requests import save_feedback, save_report, add_user, is_blocked, is_admin
 from utils.states import UserStates
+from utils.media_group import media_groups
+from utils.cleanup import cleaner
 
 user_router = Router()
 
@@ -40,6 +42,27 @@ def get_content_data(message: Message):
     return content_type, text, file_id
 
 
+def get_album_data(messages: list[Message]):
+    """Как get_content_data, но для альбома: (content_type, text, file_id, attachments).
+    attachments — [(content_type, file_id), ...] или None для одиночного сообщения"""
+    if len(messages) == 1:
+        return *get_content_data(messages[0]), None
+
+    attachments = []
+    text = None
+    for msg in messages:
+        content_type, msg_text, file_id = get_content_data(msg)
+        if file_id:
+            attachments.append((content_type, file_id))
+        text = text or msg_text  # Подпись обычно только у одного элемента альбома
+    return 'album', text, attachments[0][1] if attachments else None, attachments
+
+
+def delete_user_messages(bot: Bot, messages: list[Message]):
+    """Удаление в фоне пачкой: подтверждение пользователю его не ждёт"""
+    cleaner.schedule(bot, messages[0].chat.id, [m.message_id for m in messages])
+
+
 # --- Функция для генерации главного меню ---
 async def get_main_menu_keyboard(user_id: int) -> InlineKeyboardBuilder:
     """Генерирует клавиатуру главного меню с учётом прав пользователя"""
@@ -135,19 +158,20 @@ async def cancel_action(callback: CallbackQuery, state: FSMContext):
 # --- Обработка контента (Фидбек) ---
 @user_router.message(UserStates.send_feedback)
 async def process_feedback(message: Message, state: FSMContext, bot: Bot):
+    messages = await media_groups.collect(message)
+    if messages is None:
+        return  # Часть альбома — его целиком сохранит первый апдейт
+    
     data = await state.get_data()
     category = data.get("category")
     bot_message_id = data.get("bot_message_id")
     
-    c_type, text, file_id = get_content_data(message)
+    c_type, text, file_id, attachments = get_album_data(messages)
     
-    await save_feedback(message.from_user.id, category, c_type, text, file_id)
+    await save_feedback(message.from_user.id, category, c_type, text, file_id, attachments)
     
-    # Удаляем сообщение пользователя
-    try:
-        await message.delete()
-    except Exception:
-        pass
+    # Удаляем сообщение пользователя (весь альбом разом)
+    delete_user_messages(bot, messages)
     
     # Редактируем сообщение бота с возвратом в меню
     keyboard = await get_main_menu_keyboard(message.from_user.id)
@@ -170,18 +194,19 @@ async def process_feedback(message: Message, state: FSMContext, bot: Bot):
 # --- Обработка контента (Жалоба) ---
 @user_router.message(UserStates.send_report)
 async def process_report(message: Message, state: FSMContext, bot: Bot):
+    messages = await media_groups.collect(message)
+    if messages is None:
+        return  # Часть альбома — его целиком сохранит первый апдейт
+    
     data = await state.get_data()
     bot_message_id = data.get("bot_message_id")
     
-    c_type, text, file_id = get_content_data(message)
+    c_type, text, file_id, attachments = get_album_data(messages)
     
-    await save_report(message.from_user.id, c_type, text, file_id)
+    await save_report(message.from_user.id, c_type, text, file_id, attachments)
     
-    # Удаляем сообщение пользователя
-    try:
-        await message.delete()
-    except Exception:
-        pass
+    # Удаляем сообщение пользователя (весь альбом разом)
+    delete_user_messages(bot, messages)
     
     # Редактируем сообщение бота с возвратом в меню
     keyboard = await get_main_menu_keyboard(message.from_user.id)
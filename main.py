@@ -4,13 +4,37 @@ import sys
 import random
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart
 from aiogram.types import Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from database.requests import async_main, add_user, set_admin, is_admin
+from database.requests import (
+    async_main, add_user, set_admin, is_admin, load_ban_index, load_admin_ids,
+    ban_index, flags_cache, profile_fingerprints, item_listeners
+)
+from database.storage import SQLiteStorage
 from handlers.user import user_router, get_main_menu_keyboard
-from handlers.admin import admin_router
+from handlers.admin import admin_router, profile_info_cache, render_cache
+from utils.middlewares import (
+    JournalMiddleware, IntakeMiddleware, BanMiddleware, ProfileRefreshMiddleware, ThrottlingMiddleware, MetricsMiddleware
+)
+from utils.broadcast import broadcaster
+from utils.cleanup import cleaner
+from utils.executor import ChatEventIsolation, update_executor
+from utils.journal import journal
+from utils.notify import notifier
+from utils.media_group import media_groups
+from utils.navigation import navigation
+from utils.workers import WorkerPool, run_worker, worker_for
+from utils.api_session import ScheduledSession, TELEGRAM_GLOBAL_RATE
+from utils.metrics import metrics_handler, register_gauge
+from utils.config import (
+    API_SERVER, UPDATE_BACKLOG, WORKERS, WORKER_INDEX, WORKER_PORT, THROTTLE_GLOBAL_LIMIT,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEB_HOST, WEB_PORT
+)
 
 load_dotenv()
 
@@ -19,13 +43,114 @@ TOKEN = os.getenv('bot_token')
 if not TOKEN:
     sys.exit("Error: bot_token not found in .env")
 
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
+# Все вызовы API идут через очередь с приоритетами и лимитами Telegram,
+# а пачки из getUpdates попадают в журнал раньше, чем в диспетчер
+session_options = {"api": TelegramAPIServer.from_base(API_SERVER)} if API_SERVER else {}
+if WORKER_INDEX is not None:
+    # Лимит Telegram общий на бота — делим его между воркерами
+    session_options["global_rate"] = TELEGRAM_GLOBAL_RATE / WORKERS
+bot = Bot(token=TOKEN, session=ScheduledSession(on_updates=journal.record, **session_options))
+# FSM переживает рестарты: состояние и данные лежат в SQLite
+storage = SQLiteStorage()
+# Разные чаты параллельно (не больше update_concurrency), один чат — по порядку.
+# Очередь чата — это events_isolation FSM, так что состояние читается уже в ней.
+# FSM-middleware подключаем сами ниже, после журнала и входа альбомов
+dp = Dispatcher(storage=storage, events_isolation=ChatEventIsolation(update_executor), disable_fsm=True)
+dp.startup.register(storage.purge_expired)
+# Рассылки, прерванные рестартом, продолжаются с места остановки.
+# Среди воркеров каждую ведёт тот, кому принадлежит чат её админа (туда же идут его кнопки)
+if WORKER_INDEX is not None:
+    broadcaster.owns = lambda chat_id: worker_for(chat_id, WORKERS) == WORKER_INDEX
+dp.startup.register(broadcaster.resume_all)
+
+# Апдейты, не дообработанные до падения или рестарта, прогоняем заново (в фоне)
+async def replay_journal(dispatcher: Dispatcher, bot: Bot):
+    journal.start_replay(dispatcher, bot, UPDATE_BACKLOG)
+
+# У воркеров журнала нет: его ведёт ingress, а повторы отсекает до раздачи
+if WORKER_INDEX is None:
+    dp.startup.register(replay_journal)
+    dp.shutdown.register(journal.close)
+    # Журнал первым: повторы одного update_id дальше не идут
+    dp.update.outer_middleware(JournalMiddleware())
+# Куски альбома, который уже собирает хендлер, идут к нему мимо очереди чата
+dp.update.outer_middleware(IntakeMiddleware(media_groups.offer))
+# Очередь чата и чтение FSM
+dp.update.outer_middleware(dp.fsm)
+
+# Баны проверяем до всех хендлеров
+dp.update.outer_middleware(BanMiddleware())
+
+# Актуализируем профили пользователей по любым апдейтам, а не только по /start
+profile_refresh = ProfileRefreshMiddleware()
+dp.update.outer_middleware(profile_refresh)
+dp.shutdown.register(profile_refresh.flush)
+
+# Новый фидбек и жалобы сразу уходят админам (всплески — одной сводкой)
+item_listeners.append(notifier.push)
+dp.startup.register(notifier.start)
+dp.shutdown.register(notifier.flush)
+
+# Флуд не доходит ни до одного хендлера (ни записи в БД, ни лишних вызовов API).
+# Счётчики у каждого процесса свои, поэтому общий лимит делим между воркерами
+throttling = ThrottlingMiddleware(
+    global_limit=max(1, THROTTLE_GLOBAL_LIMIT // WORKERS) if WORKER_INDEX is not None else THROTTLE_GLOBAL_LIMIT
+)
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+
+# Время работы каждого хендлера (inner middleware на dp действует во всех роутерах)
+metrics_middleware = MetricsMiddleware()
+dp.message.middleware(metrics_middleware)
+dp.callback_query.middleware(metrics_middleware)
 
 # Подключаем роутеры
 dp.include_router(admin_router)  # Админ роутер первым, чтобы перехватывать команды
 dp.include_router(user_router)
 
+def setup_metrics():
+    """Gauges для /metrics: считаются в момент запроса"""
+    caches = {
+        "flags": flags_cache, "profile_fingerprints": profile_fingerprints,
+        "profile_info": profile_info_cache, "render": render_cache, "fsm": storage.cache,
+    }
+    register_gauge("bot_api_queue_depth", "Вызовов Bot API в очереди",
+                   lambda: [({"priority": p}, n) for p, n in bot.session.metrics()["queue_depth"].items()])
+    register_gauge("bot_cleanup_backlog", "Сообщений в очереди на удаление",
+                   lambda: [({}, cleaner.backlog_size())])
+    register_gauge("bot_profile_refresh_pending", "Профилей, ждущих записи в БД",
+                   lambda: [({}, len(profile_refresh.pending))])
+    register_gauge("bot_broadcasts_running", "Идущих рассылок",
+                   lambda: [({}, len(broadcaster.running()))])
+    register_gauge("bot_fsm_states", "Ключей FSM в памяти по состояниям",
+                   lambda: [({"state": state or "none"}, n) for state, n in storage.state_counts().items()])
+    register_gauge("bot_fsm_dirty", "Изменений FSM, ещё не записанных в БД",
+                   lambda: [({}, storage.dirty_count())])
+    register_gauge("bot_cache_hit_ratio", "Доля попаданий в кэш",
+                   lambda: [({"cache": name}, cache.hit_ratio) for name, cache in caches.items()])
+    register_gauge("bot_cache_size", "Записей в кэше",
+                   lambda: [({"cache": name}, len(cache)) for name, cache in caches.items()])
+    register_gauge("bot_banned_users", "Забаненных в индексе",
+                   lambda: [({}, len(ban_index))])
+    register_gauge("bot_nav_screens", "Экранов «назад» в навигации админов",
+                   lambda: [({}, navigation.size())])
+    register_gauge("bot_notify_pending", "Обращений, ждущих сводки для админов",
+                   lambda: [({}, notifier.pending_count())])
+    register_gauge("bot_throttled_updates", "Апдейтов, отброшенных защитой от флуда",
+                   lambda: [({}, throttling.dropped)])
+    register_gauge("bot_updates_in_flight", "Апдейтов в обработке",
+                   lambda: [({}, update_executor.in_flight)])
+    register_gauge("bot_updates_queued", "Апдейтов, ждущих своей очереди (чата или общего лимита)",
+                   lambda: [({}, update_executor.queued)])
+    register_gauge("bot_update_chats", "Чатов с апдейтами в работе или в очереди",
+                   lambda: [({}, update_executor.keys())])
+    register_gauge("bot_journal_pending", "Апдейтов в журнале без отметки об обработке",
+                   lambda: [({}, len(journal.pending))])
+    register_gauge("bot_throttle_temp_bans", "Временных банов за флуд",
+                   lambda: [({}, len(throttling.temp_bans))])
+
+setup_metrics()
+
 def get_random_welcome_sticker():
     stickers = ["CAACAgIAAxkBAAEU3JBpSyNlsQ5lBKzKMxdy-fozh-poNQAC9SwAApB_iElQpWlBK-7ghzYE", "CAACAgQAAxkBAAEU3I5pSyNWNe1Lqe_vR0TBST_B0IPlLwACyAoAAuBWgVDzFIAWz9caRzYE",
                 "CAACAgQAAxkBAAEU3IxpSyNTmrSOSE_6RoMJgAcTbdZb-gACLA4AAkergVAfseRQjo3VVDYE", "CAACAgIAAxkBAAEU3IppSyNHFI4CZGGe25hNh2nJpXm5JAACLVYAAlx4QEvGY5AYemj_gzYE",
@@ -90,10 +215,141 @@ async def start(message: Message):
     )
 
 
+def build_web_app() -> web.Application:
+    """aiohttp-приложение для вебхука (слушает порт из EXPOSE)"""
+    app = web.Application()
+    # handle_in_background: сразу отвечаем Telegram, а апдейт обрабатываем в фоне
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    app.router.add_get("/metrics", metrics_handler)
+    return app
+
+
+async def start_web(app: web.Application, port: int = WEB_PORT) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEB_HOST, port).start()
+    return runner
+
+
+async def start_metrics(port: int = WEB_PORT):
+    """Отдельный /metrics, когда вебхука на этом порту нет (None, если порт занят)"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    try:
+        runner = await start_web(app, port)
+        print(f"Metrics on {WEB_HOST}:{port}/metrics")
+        return runner
+    except OSError as e:
+        print(f"Metrics server failed to start ({e})")
+        return None
+
+
+async def run_webhook():
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=False,  # Накопившееся за время простоя обработаем, а не выбросим
+    )
+
+    runner = await start_web(build_web_app())
+    print(f"Webhook listening on {WEB_HOST}:{WEB_PORT}{WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()  # Работаем, пока не остановят
+    finally:
+        await runner.cleanup()
+
+
+async def run_polling():
+    # Вебхука нет, но /metrics всё равно отдаём на том же порту
+    runner = await start_metrics()
+
+    try:
+        await bot.delete_webhook(drop_pending_updates=False)
+        # Обработку ограничивает ChatOrderMiddleware; здесь — сколько апдейтов берём в работу,
+        # в том числе из хвоста, накопившегося за простой
+        await dp.start_polling(bot, tasks_concurrency_limit=UPDATE_BACKLOG)
+    finally:
+        if runner:
+            await runner.cleanup()
+
+
+async def run_ingress():
+    """Режим workers > 1: принимаем апдейты и раздаём их процессам-воркерам"""
+    pool = WorkerPool(WORKERS, [sys.executable, "-u", os.path.abspath(__file__)], UPDATE_BACKLOG)
+    register_gauge("bot_worker_unacked", "Апдейтов у воркера без подтверждения",
+                   lambda: [({"worker": w.index}, len(w.unacked)) for w in pool.workers])
+    register_gauge("bot_worker_restarts", "Перезапусков воркера",
+                   lambda: [({"worker": w.index}, w.restarts) for w in pool.workers])
+    await pool.start()
+    pool.replay()
+    await pool.wait_ready()
+    print(f"Ingress: {WORKERS} workers")
+
+    runner = None
+    try:
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=False,
+            )
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, pool.webhook_handler(bot, WEBHOOK_SECRET))
+            app.router.add_get("/metrics", metrics_handler)
+            runner = await start_web(app)
+            print(f"Webhook listening on {WEB_HOST}:{WEB_PORT}{WEBHOOK_PATH}")
+            await asyncio.Event().wait()
+        else:
+            runner = await start_metrics()
+            await bot.delete_webhook(drop_pending_updates=False)
+            await pool.poll(bot, dp.resolve_used_update_types())
+    finally:
+        await pool.close()
+        journal.close()
+        if runner:
+            await runner.cleanup()
+        await bot.session.close()
+
+
+async def run_worker_process():
+    # /metrics каждого воркера — на следующих за web_port портах
+    runner = await start_metrics(WEB_PORT + 1 + WORKER_INDEX)
+    try:
+        await run_worker(dp, bot, WORKER_INDEX, WORKER_PORT)
+    finally:
+        if runner:
+            await runner.cleanup()
+
+
 async def main():
-    await async_main()  # Инит БД
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    await async_main()  # Инит БД (воркеры стартуют, когда ingress уже прогнал миграции)
+    if WORKER_INDEX is None and WORKERS > 1:
+        journal.open()
+        return await run_ingress()
+
+    await load_ban_index()
+    await load_admin_ids()
+    if WORKER_INDEX is not None:
+        return await run_worker_process()
+    journal.open()
+
+    if WEBHOOK_URL:
+        try:
+            return await run_webhook()
+        except Exception as e:
+            # Не смогли поставить вебхук — откатываемся на polling
+            print(f"Webhook setup failed ({e}), falling back to polling")
+
+    await run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+"""Служебные команды: python manage.py <команда>"""
+import argparse
+import asyncio
+
+from database.requests import async_main, reconcile_counters, get_counters, rebuild_search, recluster_feedback
+
+
+async def cmd_reconcile(args):
+    await async_main()
+    await reconcile_counters()
+    counters = await get_counters(
+        "users", "users:banned", "feedback", "feedback:idea", "feedback:bug", "feedback:review", "report"
+    )
+    for key, value in counters.items():
+        print(f"{key}: {value}")
+
+
+async def cmd_rebuild_fts(args):
+    await async_main()
+    await rebuild_search()
+    print("FTS-индексы перестроены")
+
+
+async def cmd_rebuild_clusters(args):
+    await async_main()
+    await recluster_feedback()
+    print("Кластеры похожего фидбека пересобраны")
+
+
+COMMANDS = {
+    "reconcile": (cmd_reconcile, "Пересчитать таблицу counters с нуля"),
+    "rebuild-fts": (cmd_rebuild_fts, "Перестроить полнотекстовые индексы фидбека и жалоб"),
+    "rebuild-clusters": (cmd_rebuild_clusters, "Пересобрать кластеры похожего фидбека"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text)
+
+    args = parser.parse_args()
+    handler, _ = COMMANDS[args.command]
+    asyncio.run(handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Общие заготовки тестов: диспетчер с той же цепочкой middleware, что в main.py, и апдейты"""
+import asyncio
+import os
+import tempfile
+
+# database.requests создаёт движок при импорте — тестам своя база, а не data/storage.db
+os.environ.setdefault("database_url", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='bot_tests_')}/storage.db")
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Message, Update
+
+from utils.executor import ChatEventIsolation, KeyedExecutor
+from utils.media_group import MediaGroupCollector
+from utils.middlewares import IntakeMiddleware
+
+CHAT_ID = 1001
+USER = {"id": CHAT_ID, "is_bot": False, "first_name": "Test"}
+CHAT = {"id": CHAT_ID, "type": "private", "first_name": "Test"}
+
+
+class Form(StatesGroup):
+    text = State()
+
+
+def make_dispatcher(router: Router, collector: MediaGroupCollector, *outer) -> Dispatcher:
+    """Та же цепочка outer middleware, что в main.py: [журнал] -> вход альбомов -> очередь чата + FSM"""
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=ChatEventIsolation(KeyedExecutor(8)), disable_fsm=True)
+    for middleware in outer:
+        dp.update.outer_middleware(middleware)
+    dp.update.outer_middleware(IntakeMiddleware(collector.offer))
+    dp.update.outer_middleware(dp.fsm)
+    dp.include_router(router)
+    return dp
+
+
+def message(update_id: int, message_id: int, **fields) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {"message_id": message_id, "date": 0, "chat": CHAT, "from": USER, **fields},
+    }
+
+
+def callback(update_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": USER, "chat_instance": "1", "data": data,
+            "message": {"message_id": 1, "date": 0, "chat": CHAT, "text": "menu"},
+        },
+    }
+
+
+async def feed_all(dp: Dispatcher, bot: Bot, updates: list):
+    await asyncio.gather(*(dp.feed_update(bot, Update.model_validate(u, context={"bot": bot})) for u in updates))
+
+
+def feedback_router():
+    """Кнопка ставит состояние (не сразу), следующее сообщение должно попасть в хендлер состояния"""
+    router = Router()
+    hits = []
+
+    @router.callback_query(F.data == "feedback")
+    async def start_feedback(call: CallbackQuery, state: FSMContext):
+        await asyncio.sleep(0.05)  # Хендлер ещё работает, а сообщение уже пришло
+        await state.set_state(Form.text)
+
+    @router.message(Form.text)
+    async def got_feedback(msg: Message, state: FSMContext):
+        hits.append("feedback")
+        await state.clear()
+
+    @router.message()
+    async def fallback(msg: Message):
+        hits.append("fallback")
+
+    return router, hits
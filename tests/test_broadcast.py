@@ -0,0 +1,20 @@
+import asyncio
+
+import database.requests as rq
+
+
+def test_final_status_keeps_cancel_from_other_process():
+    async def scenario():
+        await rq.async_main()
+        broadcast = await rq.create_broadcast(1, 1)
+        # Другой процесс отменил рассылку, пока эта дописывала последнюю пачку
+        assert await rq.cancel_broadcast(broadcast.id)
+        stored = await rq.save_broadcast_progress(broadcast.id, 10, 9, 1, "done")
+        saved = await rq.get_broadcast(broadcast.id)
+        await rq.engine.dispose()
+        await rq.read_engine.dispose()
+        return stored, saved
+
+    stored, saved = asyncio.run(scenario())
+    assert stored == "cancelled"
+    assert (saved.status, saved.sent, saved.failed) == ("cancelled", 9, 1)
@@ -0,0 +1,43 @@
+import asyncio
+
+from aiogram import Bot, F, Router
+from aiogram.types import Message
+
+from conftest import callback, feed_all, feedback_router, make_dispatcher, message
+from utils.media_group import MediaGroupCollector
+
+
+def test_message_after_callback_sees_new_state():
+    router, hits = feedback_router()
+
+    async def scenario():
+        bot = Bot("42:TEST")
+        dp = make_dispatcher(router, MediaGroupCollector())
+        await feed_all(dp, bot, [callback(1, "feedback"), message(2, 2, text="hello")])
+        await bot.session.close()
+
+    asyncio.run(scenario())
+    assert hits == ["feedback"]
+
+
+def test_album_pieces_join_owner_past_chat_queue():
+    router = Router()
+    collector = MediaGroupCollector(delay=0.05)
+    albums = []
+
+    @router.message(F.media_group_id)
+    async def album(msg: Message):
+        messages = await collector.collect(msg)
+        if messages is not None:
+            albums.append([m.message_id for m in messages])
+
+    photo = [{"file_id": "f", "file_unique_id": "u", "width": 1, "height": 1}]
+
+    async def scenario():
+        bot = Bot("42:TEST")
+        dp = make_dispatcher(router, collector)
+        await feed_all(dp, bot, [message(10 + i, 10 + i, media_group_id="g", photo=photo) for i in range(3)])
+        await bot.session.close()
+
+    asyncio.run(scenario())
+    assert albums == [[10, 11, 12]]
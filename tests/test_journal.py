@@ -0,0 +1,52 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.types import Update
+
+import utils.middlewares
+from conftest import callback, feedback_router, make_dispatcher, message
+from utils.journal import UpdateJournal
+from utils.media_group import MediaGroupCollector
+from utils.middlewares import JournalMiddleware
+
+
+def test_replay_keeps_chat_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "journal.jsonl")
+    bot = Bot("42:TEST")
+    updates = [Update.model_validate(u) for u in (callback(1, "feedback"), message(2, 2, text="hello"))]
+
+    # Прошлый запуск: пачка записана, но до диспетчера не дошла
+    crashed = UpdateJournal(path)
+    crashed.open()
+    asyncio.run(crashed.record(updates))
+    crashed.close()
+
+    journal = UpdateJournal(path)
+    journal.open()
+    assert sorted(journal.pending) == [1, 2]
+    monkeypatch.setattr(utils.middlewares, "journal", journal)
+
+    router, hits = feedback_router()
+
+    async def scenario():
+        dp = make_dispatcher(router, MediaGroupCollector(), JournalMiddleware())
+        await journal.replay(dp, bot, concurrency=8)
+        await bot.session.close()
+
+    asyncio.run(scenario())
+    assert hits == ["feedback"]
+    assert not journal.pending
+
+
+def test_record_batches_fsync(tmp_path):
+    journal = UpdateJournal(str(tmp_path / "journal.jsonl"))
+    journal.open()
+
+    async def scenario():
+        batches = [[Update.model_validate(message(i, i, text="x"))] for i in range(1, 21)]
+        await asyncio.gather(*(journal.record(batch) for batch in batches))
+
+    asyncio.run(scenario())
+    assert len(journal.pending) == 20
+    # Все 20 пачек записаны до того, как fsync начался, — им хватает одного
+    assert journal.syncs == 1
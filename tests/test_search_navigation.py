@@ -0,0 +1,25 @@
+import asyncio
+
+import database.requests as rq
+from handlers.admin import render_search_page
+from utils.navigation import ItemCb, SearchPageCb, navigation
+
+ADMIN_ID = 7
+USER_ID = 70
+
+
+def test_results_page_does_not_depend_on_fsm():
+    async def scenario():
+        await rq.async_main()
+        await rq.upsert_users({USER_ID: ("author", "Author")})
+        await rq.save_feedback(USER_ID, "bug", "text", "не проходит оплата картой")
+        _, markup = await render_search_page(ADMIN_ID, "feedback", "оплата", 1)
+        await rq.engine.dispose()
+        await rq.read_engine.dispose()
+        return markup
+
+    markup = asyncio.run(scenario())
+    # «К результатам» на карточке ведёт на страницу, которая сама знает свой запрос
+    item = ItemCb.unpack(markup.inline_keyboard[0][0].callback_data)
+    page = SearchPageCb.unpack(navigation.resolve(ADMIN_ID, item.back))
+    assert navigation.resolve(ADMIN_ID, page.query) == "оплата"
@@ -0,0 +1,47 @@
+import asyncio
+
+import database.storage
+from aiogram.fsm.storage.base import StorageKey
+from database.storage import SQLiteStorage
+
+
+class FailingSession:
+    """Сессия, на которой падает первая запись (как при database is locked)"""
+
+    def __init__(self, factory, failures: list):
+        self.factory = factory
+        self.failures = failures
+
+    def __call__(self):
+        if self.failures:
+            self.failures.pop()
+            raise RuntimeError("database is locked")
+        return self.factory()
+
+
+def test_failed_background_flush_is_retried(monkeypatch):
+    key = StorageKey(bot_id=42, chat_id=5, user_id=5)
+
+    async def scenario():
+        import database.requests as rq
+        await rq.async_main()
+        storage = SQLiteStorage(flush_delay=0.01, retry_delay=0.01)
+        await storage.set_state(key, "Form:text")
+        # Чтение уже было, падает именно фоновая запись
+        monkeypatch.setattr(
+            database.storage, "async_session", FailingSession(database.storage.async_session, [1])
+        )
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not storage.dirty_count():
+                break
+        dirty = storage.dirty_count()
+        # Свежее хранилище читает из БД — значит, повтор записал состояние
+        state = await SQLiteStorage().get_state(key)
+        await rq.engine.dispose()
+        await rq.read_engine.dispose()
+        return dirty, state
+
+    dirty, state = asyncio.run(scenario())
+    assert dirty == 0
+    assert state == "Form:text"
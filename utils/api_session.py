@@ -0,0 +1,206 @@
+import asyncio
+import itertools
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.types import Update
+
+from database.requests import admin_ids
+from utils.cache import LRUCache
+from utils.metrics import api_errors, api_latency, api_queue_wait, api_retries
+from utils.ratelimit import TokenBucket
+
+
+class Priority(IntEnum):
+    USER = 0     # Ответы пользователям
+    ADMIN = 1    # Интерфейс админки
+    CLEANUP = 2  # Удаление служебных сообщений
+    BULK = 3     # Рассылки
+
+
+# Общий лимит Telegram на исходящие сообщения бота, в секунду
+TELEGRAM_GLOBAL_RATE = 30
+
+# Явный приоритет для текущей задачи (например, рассылка ставит BULK)
+api_priority: ContextVar[Optional[Priority]] = ContextVar("api_priority", default=None)
+
+# Эти методы идут мимо очереди: long polling и служебные вызовы
+BYPASS_METHODS = {
+    "getUpdates", "getMe", "setWebhook", "deleteWebhook", "getWebhookInfo",
+    "getFile", "close", "logOut",
+}
+CLEANUP_METHODS = {"deleteMessage", "deleteMessages"}
+# Отправка новых сообщений упирается в лимит ~1 сообщение/с на чат и ~30/с на бота.
+# Правки, ответы на callback и удаления под эти лимиты не попадают — идут только по приоритету
+CHAT_LIMITED_PREFIXES = ("send", "copyMessage", "forwardMessage")
+
+
+class ScheduledSession(AiohttpSession):
+    """Сессия бота, которая пропускает все вызовы API через очередь с приоритетами.
+
+    Соблюдает глобальный и по-чатовый лимиты Telegram на отправку сообщений
+    и сама повторяет запросы, получившие RetryAfter (429). on_updates получает каждую пачку
+    из getUpdates раньше диспетчера (так её успевает записать журнал).
+    """
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        workers: int = 8,
+        max_retries: int = 3,
+        on_updates: Optional[Callable[[List[Update]], Awaitable[None]]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = LRUCache(maxsize=10000, ttl=60)
+        self.workers_count = workers
+        self.max_retries = max_retries
+        self.on_updates = on_updates
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._seq = itertools.count()
+
+        # Метрики
+        self.queued = {priority: 0 for priority in Priority}
+        self.waits = {priority: {"count": 0, "sum": 0.0, "max": 0.0} for priority in Priority}
+        self.retries = 0
+
+    # --- Классификация ---
+    @staticmethod
+    def _chat_id(method: TelegramMethod) -> Optional[int]:
+        chat_id = getattr(method, "chat_id", None)
+        return chat_id if isinstance(chat_id, int) else None
+
+    def _priority(self, method: TelegramMethod) -> Priority:
+        explicit = api_priority.get()
+        if explicit is not None:
+            return explicit
+        if method.__api_method__ in CLEANUP_METHODS:
+            return Priority.CLEANUP
+        if self._chat_id(method) in admin_ids:
+            return Priority.ADMIN
+        return Priority.USER
+
+    @staticmethod
+    def _is_send(method: TelegramMethod) -> bool:
+        return method.__api_method__.startswith(CHAT_LIMITED_PREFIXES)
+
+    def _chat_bucket(self, method: TelegramMethod) -> Optional[TokenBucket]:
+        chat_id = self._chat_id(method)
+        if chat_id is None or not self._is_send(method):
+            return None
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self.chat_buckets.set(chat_id, bucket)  # продлеваем TTL
+        return bucket
+
+    # --- Очередь ---
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        if method.__api_method__ in BYPASS_METHODS:
+            result = await self._timed_request(bot, method, timeout)
+            if self.on_updates and isinstance(method, GetUpdates) and result:
+                await self.on_updates(result)
+            return result
+
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        job = {
+            "bot": bot, "method": method, "timeout": timeout, "future": future,
+            "priority": self._priority(method), "enqueued_at": time.monotonic(), "attempt": 0,
+        }
+        self._put(job)
+        return await future
+
+    def _put(self, job: dict):
+        self.queued[job["priority"]] += 1
+        self._queue.put_nowait((job["priority"], next(self._seq), job))
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            self.queued[job["priority"]] -= 1
+            future = job["future"]
+            if future.done():  # Вызвавший уже не ждёт (отменили)
+                continue
+
+            # Чат упёрся в лимит — откладываем задачу, не занимая воркер
+            chat_bucket = self._chat_bucket(job["method"])
+            if chat_bucket is not None and not chat_bucket.try_acquire():
+                self.queued[job["priority"]] += 1
+                loop.call_later(chat_bucket.delay(), self._requeue, job)
+                continue
+
+            if self._is_send(job["method"]):
+                await self.global_bucket.acquire()
+            self._record_wait(job)
+
+            try:
+                result = await self._timed_request(job["bot"], job["method"], job["timeout"])
+            except TelegramRetryAfter as e:
+                job["attempt"] += 1
+                if job["attempt"] > self.max_retries:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                # Флуд в конкретном чате тормозит только этот чат, иначе — всех
+                self.retries += 1
+                api_retries.inc(job["method"].__api_method__)
+                (chat_bucket or self.global_bucket).pause(e.retry_after)
+                self.queued[job["priority"]] += 1
+                loop.call_later(e.retry_after, self._requeue, job)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    async def _timed_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int]) -> Any:
+        started = time.perf_counter()
+        try:
+            return await super().make_request(bot, method, timeout)
+        except Exception as e:
+            api_errors.inc(method.__api_method__, type(e).__name__)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - started, method.__api_method__)
+
+    def _requeue(self, job: dict):
+        self.queued[job["priority"]] -= 1
+        self._put(job)
+
+    def _record_wait(self, job: dict):
+        wait = time.monotonic() - job["enqueued_at"]
+        stats = self.waits[job["priority"]]
+        stats["count"] += 1
+        stats["sum"] += wait
+        stats["max"] = max(stats["max"], wait)
+        api_queue_wait.observe(wait, job["priority"].name.lower())
+
+    def metrics(self) -> Dict[str, Any]:
+        """Глубина очереди и время ожидания по приоритетам"""
+        return {
+            "queue_depth": {priority.name.lower(): count for priority, count in self.queued.items()},
+            "wait_seconds": {priority.name.lower(): dict(stats) for priority, stats in self.waits.items()},
+            "retries": self.retries,
+        }
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from typing import Callable, Dict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from database.models import Broadcast
+from database.requests import (
+    cancel_broadcast, get_running_broadcasts, save_broadcast_progress, stream_broadcast_recipients
+)
+from utils.api_session import Priority, api_priority
+from utils.navigation import BroadcastCb
+from utils.ratelimit import TokenBucket
+
+# Лимит Telegram на рассылку ~30 сообщений/с; держимся чуть ниже.
+# По-чатовый лимит (1 сообщение/с в чат) соблюдается сам: каждому пользователю уходит одно сообщение
+BROADCAST_RATE = 25
+
+
+def format_progress(stats: dict) -> str:
+    done = stats["sent"] + stats["failed"]
+    elapsed = max(time.monotonic() - stats["started_at"], 1e-6)
+    speed = (done - stats["done_at_start"]) / elapsed
+    statuses = {
+        "running": "⏳ Идёт", "done": "✅ Завершена", "cancelled": "⏹ Остановлена", "failed": "⚠️ Прервана ошибкой",
+    }
+
+    return (
+        f"📢 <b>Рассылка #{stats['id']}</b>\n\n"
+        f"Статус: {statuses.get(stats['status'], stats['status'])}\n"
+        f"Обработано: {done}/{stats['total']}\n"
+        f"✅ Доставлено: {stats['sent']}\n"
+        f"❌ Ошибок: {stats['failed']}\n"
+        f"⚡ Скорость: {speed:.1f} сообщ./с"
+    )
+
+
+def progress_keyboard(stats: dict):
+    kb = InlineKeyboardBuilder()
+    if stats["status"] == "running":
+        kb.button(text="🔄 Обновить", callback_data=BroadcastCb(action="status", broadcast_id=stats["id"]))
+        kb.button(text="⏹ Остановить", callback_data=BroadcastCb(action="stop", broadcast_id=stats["id"]))
+    kb.button(text="🏠 Домой", callback_data="home")
+    kb.adjust(2, 1)
+    return kb.as_markup()
+
+
+def stats_from_db(broadcast: Broadcast) -> dict:
+    """Прогресс рассылки, которая идёт не в этом процессе (или уже закончилась), по данным из БД"""
+    return {
+        "id": broadcast.id, "status": broadcast.status, "total": broadcast.total,
+        "sent": broadcast.sent, "failed": broadcast.failed,
+        "done_at_start": broadcast.sent + broadcast.failed, "started_at": 0,
+    }
+
+
+class Broadcaster:
+    """Фоновые рассылки с ограничением скорости и сохранением прогресса.
+
+    Рассылка идёт в процессе, которому принадлежит чат её админа (owns), —
+    туда же приходят его кнопки. Остальные процессы видят её и отменяют через БД.
+    """
+
+    def __init__(self, rate: float = BROADCAST_RATE, save_every: int = 50, progress_interval: float = 5.0):
+        self.bucket = TokenBucket(rate)
+        self.save_every = save_every
+        self.progress_interval = progress_interval
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.stats: Dict[int, dict] = {}
+        # admin_chat_id -> рассылка наша; в режиме воркеров задаёт main.py
+        self.owns: Callable[[int], bool] = lambda chat_id: True
+
+    def start(self, bot: Bot, broadcast: Broadcast):
+        if broadcast.id in self.tasks:
+            return
+        self.stats[broadcast.id] = {
+            "id": broadcast.id,
+            "status": "running",
+            "total": broadcast.total,
+            "sent": broadcast.sent,
+            "failed": broadcast.failed,
+            "last_user_id": broadcast.last_user_id,
+            "done_at_start": broadcast.sent + broadcast.failed,
+            "started_at": time.monotonic(),
+            "progress_msg_id": None,
+            "cancelled": False,
+        }
+        self.tasks[broadcast.id] = asyncio.create_task(self._run(bot, broadcast))
+
+    async def resume_all(self, bot: Bot):
+        """Продолжает рассылки, прерванные рестартом (только свои)"""
+        for broadcast in await get_running_broadcasts():
+            if self.owns(broadcast.admin_chat_id):
+                self.start(bot, broadcast)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        stats = self.stats.get(broadcast_id)
+        if stats and stats["status"] == "running":
+            stats["cancelled"] = True
+            return True
+        # Рассылка в другом процессе: отменяем через БД
+        return await cancel_broadcast(broadcast_id)
+
+    def running(self) -> list:
+        return [stats for stats in self.stats.values() if stats["status"] == "running"]
+
+    async def _run(self, bot: Bot, broadcast: Broadcast):
+        # Рассылка пропускает вперёд всё остальное (контекст свой у каждой задачи)
+        api_priority.set(Priority.BULK)
+        stats = self.stats[broadcast.id]
+        last_report = time.monotonic()
+        processed = 0
+
+        try:
+            async for user_id, telegram_id in stream_broadcast_recipients(broadcast.last_user_id):
+                if stats["cancelled"]:
+                    break
+
+                if telegram_id != broadcast.admin_chat_id:
+                    if await self._send(bot, telegram_id, broadcast):
+                        stats["sent"] += 1
+                    else:
+                        stats["failed"] += 1
+                stats["last_user_id"] = user_id
+                processed += 1
+
+                if processed % self.save_every == 0 and await self._save(stats) == "cancelled":
+                    stats["cancelled"] = True
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    await self._report(bot, broadcast, stats)
+
+            stats["status"] = "cancelled" if stats["cancelled"] else "done"
+            # Если её успели отменить из другого процесса, в БД останется cancelled
+            stats["status"] = await self._save(stats) or stats["status"]
+            await self._report(bot, broadcast, stats)
+        except Exception as e:
+            # Например, "database is locked": не оставляем рассылку висеть в running
+            print(f"Broadcast #{broadcast.id} failed: {e}")
+            stats["status"] = "failed"
+            try:
+                stats["status"] = await self._save(stats) or stats["status"]
+            except Exception as save_error:
+                print(f"Broadcast #{broadcast.id}: could not save status ({save_error})")
+            await self._report(bot, broadcast, stats)
+        finally:
+            self.tasks.pop(broadcast.id, None)
+
+    async def _send(self, bot: Bot, telegram_id: int, broadcast: Broadcast) -> bool:
+        network_retries = 3
+        while True:
+            await self.bucket.acquire()
+            try:
+                await bot.copy_message(
+                    chat_id=telegram_id,
+                    from_chat_id=broadcast.admin_chat_id,
+                    message_id=broadcast.message_id,
+                )
+                return True
+            except TelegramRetryAfter as e:
+                # Flood control: тормозим всю рассылку и пробуем этого же пользователя ещё раз
+                self.bucket.pause(e.retry_after)
+            except TelegramNetworkError:
+                network_retries -= 1
+                if network_retries < 0:
+                    return False
+                await asyncio.sleep(5)
+            except TelegramAPIError:
+                # Бот заблокирован, чат не найден и т.п.
+                return False
+
+    async def _save(self, stats: dict) -> str:
+        status = stats["status"] if stats["status"] != "running" else None
+        return await save_broadcast_progress(stats["id"], stats["last_user_id"], stats["sent"], stats["failed"], status)
+
+    async def _report(self, bot: Bot, broadcast: Broadcast, stats: dict):
+        """Живой прогресс в чате админа: одно сообщение, которое редактируем"""
+        text = format_progress(stats)
+        try:
+            if stats["progress_msg_id"]:
+                await bot.edit_message_text(
+                    text, chat_id=broadcast.admin_chat_id, message_id=stats["progress_msg_id"],
+                    reply_markup=progress_keyboard(stats), parse_mode="HTML",
+                )
+            else:
+                msg = await bot.send_message(
+                    broadcast.admin_chat_id, text, reply_markup=progress_keyboard(stats), parse_mode="HTML"
+                )
+                stats["progress_msg_id"] = msg.message_id
+        except TelegramAPIError:
+            pass
+
+
+broadcaster = Broadcaster()
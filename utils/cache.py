@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Простой LRU-кэш с ограничением размера и опциональным TTL"""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            # Протухло — выкидываем и считаем как промах
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def keys(self) -> list:
+        """Все ключи от самого старого к самому свежему, без учёта в hits/misses"""
+        return list(self._data)
+
+    def values(self) -> list:
+        """Все значения (включая ещё не вычищенные протухшие), без учёта в hits/misses"""
+        return [value for _, value in self._data.values()]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class SingleFlightCache(LRUCache):
+    """LRU-кэш для асинхронных загрузок: одновременные промахи по одному
+    ключу ждут один общий запрос, а не делают каждый свой"""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        super().__init__(maxsize, ttl)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        should_cache: Callable[[Any], bool] = lambda value: True,
+    ) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._fetch(key, fetch, should_cache))
+            self._inflight[key] = inflight
+        # shield: отмена одного ожидающего не должна ронять запрос остальным
+        return await asyncio.shield(inflight)
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool]):
+        try:
+            value = await fetch()
+            if should_cache(value):
+                self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
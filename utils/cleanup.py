@@ -0,0 +1,61 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+# deleteMessages принимает до 100 id за раз
+DELETE_BATCH_SIZE = 100
+
+
+class MessageCleaner:
+    """Удаляет служебные сообщения в фоне пачками через deleteMessages.
+
+    Хендлер только ставит id в очередь и сразу рисует следующий экран.
+    Очередь на чат ограничена: если API занято, самые старые id отбрасываются.
+    """
+
+    def __init__(self, max_backlog: int = 300, retry_delay: float = 5.0):
+        self.max_backlog = max_backlog
+        self.retry_delay = retry_delay
+        self.pending: Dict[int, Deque[int]] = {}
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, bot: Bot, chat_id: int, message_ids: Iterable[int]):
+        self._bot = bot
+        backlog = self.pending.setdefault(chat_id, deque(maxlen=self.max_backlog))
+        backlog.extend(message_ids)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def backlog_size(self) -> int:
+        return sum(len(backlog) for backlog in self.pending.values())
+
+    async def _run(self):
+        while self.pending:
+            failed = False
+            for chat_id in list(self.pending):
+                backlog = self.pending.pop(chat_id)
+                message_ids = list(dict.fromkeys(backlog))  # без дублей, порядок сохраняем
+
+                for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+                    chunk = message_ids[i:i + DELETE_BATCH_SIZE]
+                    try:
+                        await self._bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+                    except (TelegramRetryAfter, TelegramNetworkError, TelegramServerError):
+                        # API занято — вернём в очередь и попробуем позже
+                        retry = self.pending.setdefault(chat_id, deque(maxlen=self.max_backlog))
+                        retry.extendleft(reversed(message_ids[i:]))
+                        failed = True
+                        break
+                    except Exception:
+                        pass  # Сообщения уже удалены или слишком старые
+
+            if failed:
+                await asyncio.sleep(self.retry_delay)
+
+
+cleaner = MessageCleaner()
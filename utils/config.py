@@ -0,0 +1,56 @@
+import os
+import secrets
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- База ---
+DATABASE_URL = os.getenv('database_url', 'sqlite+aiosqlite:///data/storage.db')
+
+# --- Bot API ---
+# Свой сервер Bot API вместо api.telegram.org: локальный telegram-bot-api
+# или стенд нагрузочного теста (bench/loadtest.py), например http://127.0.0.1:8081
+API_SERVER = os.getenv('api_server')
+
+# --- Приём апдейтов ---
+# Журнал принятых апдейтов: незавершённые при падении обрабатываются после рестарта
+JOURNAL_PATH = os.getenv('journal_path', 'data/updates.journal')
+# Сколько апдейтов обрабатывается одновременно (апдейты одного чата — всегда по очереди)
+UPDATE_CONCURRENCY = int(os.getenv('update_concurrency', 64))
+# Сколько принятых апдейтов может ждать своей очереди, прежде чем polling перестанет забирать новые
+UPDATE_BACKLOG = int(os.getenv('update_backlog', 1000))
+
+# --- Несколько процессов (см. utils/workers.py) ---
+# workers > 1: этот процесс только принимает апдейты и раздаёт их воркерам по chat_id
+WORKERS = int(os.getenv('workers', 1))
+# Задаются самим ingress при запуске воркера
+WORKER_INDEX = int(os.getenv('worker_index')) if os.getenv('worker_index') else None
+WORKER_PORT = int(os.getenv('worker_port', 0))
+
+# --- Вебхук ---
+# Если задан webhook_url (публичный адрес, например https://bot.example.com),
+# бот поднимает aiohttp на web_port и принимает апдейты вебхуком. Иначе — polling.
+WEBHOOK_URL = os.getenv('webhook_url')
+WEBHOOK_PATH = os.getenv('webhook_path', '/webhook')
+# Без явного секрета генерируем свой на каждый запуск — вебхук всё равно ставим сами
+WEBHOOK_SECRET = os.getenv('webhook_secret') or secrets.token_urlsafe(32)
+
+WEB_HOST = os.getenv('web_host', '0.0.0.0')
+WEB_PORT = int(os.getenv('web_port', 8000))
+
+# --- Защита от флуда (см. ThrottlingMiddleware) ---
+# Лимиты на скользящее окно throttle_window секунд: на пользователя и на весь бот
+# (общий — на все воркеры вместе, каждый берёт свою долю)
+THROTTLE_WINDOW = float(os.getenv('throttle_window', 60))
+THROTTLE_USER_LIMIT = int(os.getenv('throttle_user_limit', 20))
+THROTTLE_GLOBAL_LIMIT = int(os.getenv('throttle_global_limit', 1200))
+# Столько отброшенных апдейтов за окно — и пользователь получает временный бан (0 — не банить)
+THROTTLE_BAN_AFTER = int(os.getenv('throttle_ban_after', 30))
+THROTTLE_BAN_MINUTES = float(os.getenv('throttle_ban_minutes', 60))
+
+# --- Уведомления админам о новых обращениях (см. utils/notify.py) ---
+# Первое обращение приходит сразу, всё, что пришло следом в течение notify_window секунд,
+# собирается в одну сводку. 0 — не уведомлять
+NOTIFY_WINDOW = float(os.getenv('notify_window', 30))
+# Сколько обращений держим в сводке на админа; остальные — только числом «и ещё N»
+NOTIFY_MAX_PENDING = int(os.getenv('notify_max_pending', 20))
@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+from utils.config import UPDATE_CONCURRENCY
+
+
+class KeyedExecutor:
+    """Выполняет задачи параллельно, но по одной на ключ и строго в порядке поступления.
+
+    Задачи одного ключа (чата) выстраиваются цепочкой: каждая ждёт, пока
+    закончится предыдущая. Цепочка ключа существует, пока в ней есть задачи,
+    так что простаивающие чаты память не занимают. Сколько задач выполняется
+    одновременно по всем ключам — ограничивает concurrency.
+    """
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tails: Dict[Hashable, asyncio.Future] = {}  # key -> завершение последней задачи ключа
+        self.in_flight = 0
+        self.queued = 0
+
+    async def run(self, key: Optional[Hashable], func: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет func() после всех ранее поставленных задач того же ключа (None — без очереди)"""
+        async with self.slot(key):
+            return await func()
+
+    @asynccontextmanager
+    async def slot(self, key: Optional[Hashable]) -> AsyncIterator[None]:
+        """То же, что run(), но для блока async with.
+
+        Место в очереди ключа занимается ещё до первого await, поэтому порядок
+        входа в slot() и есть порядок выполнения.
+        """
+        previous = None
+        done = None
+        if key is not None:
+            previous = self.tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self.tails[key] = done
+
+        self.queued += 1
+        queued = True
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            async with self.semaphore:
+                self.queued -= 1
+                queued = False
+                self.in_flight += 1
+                try:
+                    yield
+                finally:
+                    self.in_flight -= 1
+        finally:
+            if queued:
+                self.queued -= 1
+            if done is not None:
+                self._release(key, previous, done)
+
+    def _release(self, key: Hashable, previous: Optional[asyncio.Future], done: asyncio.Future):
+        if previous is not None and not previous.done():
+            # Нас отменили, пока ждали очереди: следующий всё равно ждёт предыдущего
+            previous.add_done_callback(lambda _: self._release(key, None, done))
+            return
+        done.set_result(None)
+        if self.tails.get(key) is done:
+            del self.tails[key]  # За нами никого — ключ простаивает
+
+    def keys(self) -> int:
+        """Сколько ключей сейчас с задачами"""
+        return len(self.tails)
+
+
+class ChatEventIsolation(BaseEventIsolation):
+    """events_isolation для Dispatcher: апдейты одного чата по очереди через KeyedExecutor.
+
+    FSMContextMiddleware читает состояние уже внутри lock(), так что каждый
+    апдейт видит состояние, которое оставил предыдущий апдейт того же чата.
+    """
+
+    def __init__(self, executor: KeyedExecutor):
+        self.executor = executor
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncIterator[None]:
+        # Стратегия USER_IN_CHAT: в личке chat_id == user_id, без чата — тоже user_id
+        async with self.executor.slot(key.chat_id):
+            yield
+
+    async def close(self) -> None:
+        pass
+
+
+update_executor = KeyedExecutor(UPDATE_CONCURRENCY)
@@ -0,0 +1,181 @@
+"""Журнал апдейтов, чтобы рестарт или падение бота не теряли обращения.
+
+Апдейт записывается в файл (по JSON на строку) до того, как попадёт в
+диспетчер, а после обработки рядом дописывается отметка done. При старте
+всё, что осталось без отметки, прогоняется через диспетчер заново. Повторы
+одного update_id отбрасываются: и из журнала, и от Telegram, который не успел
+получить подтверждение offset.
+
+Пачка из getUpdates синхронизируется на диск (fsync) одним вызовом в
+потоке, не блокируя цикл событий; записи, пришедшие, пока идёт fsync,
+ждут следующего — тоже одного на всех.
+
+Файл только дописывается. Когда отметок накопится compact_every, он
+переписывается: остаются незавершённые апдейты и последние keep_done id.
+"""
+import asyncio
+import json
+import os
+from typing import Dict, Iterable, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from utils.cache import LRUCache
+from utils.config import JOURNAL_PATH
+
+
+def _dump(update: Update) -> dict:
+    """Апдейт в том же виде, в каком его прислал Telegram"""
+    return update.model_dump(mode='json', exclude_unset=True, by_alias=True)
+
+
+class UpdateJournal:
+    def __init__(self, path: str, compact_every: int = 5000, keep_done: int = 10000):
+        self.path = path
+        self.compact_every = compact_every
+        self.pending: Dict[int, dict] = {}     # update_id -> апдейт, ещё не обработан
+        self.active: Set[int] = set()          # Обрабатываются прямо сейчас
+        self.done = LRUCache(maxsize=keep_done)
+        self.replay_task: Optional[asyncio.Task] = None
+        self.syncs = 0
+        self._file = None
+        self._next_sync: Optional[asyncio.Future] = None  # Ждут fsync, который ещё не начался
+        self._sync_task: Optional[asyncio.Task] = None
+        self._done_since_compact = 0
+
+    def open(self):
+        """Читает журнал прошлого запуска; вызывать до приёма апдейтов"""
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Строка, недописанная в момент падения
+                    if 'done' in record:
+                        self.pending.pop(record['done'], None)
+                        self.done.set(record['done'], True)
+                    elif self.done.get(record['id']) is None:
+                        self.pending[record['id']] = record['update']
+        self.compact()
+        if self.pending:
+            print(f"Journal: {len(self.pending)} unfinished updates from the previous run")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, records: Iterable[dict]):
+        if self._file is None:  # Хендлер закончил уже после close() на остановке
+            self._file = open(self.path, 'a', encoding='utf-8')
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        # flush переживает падение процесса, fsync (_sync) — ещё и падение машины.
+        # Отметки done не синхронизируем: потеря такой отметки даст лишь повторную обработку
+        self._file.flush()
+
+    def _sync(self) -> asyncio.Future:
+        """Ставит fsync всего записанного; future завершится, когда данные на диске"""
+        if self._next_sync is None:
+            self._next_sync = asyncio.get_running_loop().create_future()
+            if self._sync_task is None or self._sync_task.done():
+                self._sync_task = asyncio.create_task(self._sync_loop())
+        return self._next_sync
+
+    async def _sync_loop(self):
+        while self._next_sync is not None:
+            waiters, self._next_sync = self._next_sync, None
+            # Копия дескриптора: compact() и close() могут закрыть файл, пока идёт fsync
+            fd = os.dup(self._file.fileno()) if self._file else None
+            try:
+                if fd is not None:
+                    await asyncio.to_thread(os.fsync, fd)
+                    self.syncs += 1
+            except OSError as e:
+                print(f"Journal: fsync failed: {e}")
+            finally:
+                if fd is not None:
+                    os.close(fd)
+                waiters.set_result(None)
+
+    def _is_known(self, update_id: int) -> bool:
+        return update_id in self.pending or update_id in self.active or self.done.get(update_id) is not None
+
+    async def record(self, updates: Iterable[Update]):
+        """Пишет пачку апдейтов из getUpdates до того, как их увидит диспетчер"""
+        records = []
+        for update in updates:
+            if self._is_known(update.update_id):
+                continue
+            data = _dump(update)
+            self.pending[update.update_id] = data
+            records.append({'id': update.update_id, 'update': data})
+        if records:
+            self._write(records)
+            await asyncio.shield(self._sync())
+
+    def begin(self, update: Update) -> bool:
+        """False — этот апдейт уже обработан или обрабатывается"""
+        update_id = update.update_id
+        if update_id in self.active or self.done.get(update_id) is not None:
+            return False
+        if update_id not in self.pending:
+            # Пришёл мимо record (вебхук). Ждать fsync здесь нельзя — порядок апдейтов
+            # чата держится на том, что до очереди чата нет await; fsync догонит следом
+            self.pending[update_id] = _dump(update)
+            self._write([{'id': update_id, 'update': self.pending[update_id]}])
+            self._sync()
+        self.active.add(update_id)
+        return True
+
+    def finish(self, update_id: int):
+        self.active.discard(update_id)
+        self.pending.pop(update_id, None)
+        self.done.set(update_id, True)
+        self._write([{'done': update_id}])
+        self._done_since_compact += 1
+        if self._done_since_compact >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Переписывает файл: незавершённые апдейты и последние обработанные id"""
+        self.close()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for update_id in self.done.keys():
+                f.write(json.dumps({'done': update_id}) + '\n')
+            for update_id, data in self.pending.items():
+                f.write(json.dumps({'id': update_id, 'update': data}, ensure_ascii=False, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._done_since_compact = 0
+
+    async def replay(self, dispatcher: Dispatcher, bot: Bot, concurrency: int):
+        """Прогоняет незавершённые апдейты через диспетчер, не больше concurrency одновременно"""
+        updates = [data for _, data in sorted(self.pending.items())]
+        if not updates:
+            return
+        print(f"Journal: replaying {len(updates)} updates")
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def feed(data: dict):
+            async with semaphore:
+                try:
+                    await dispatcher.feed_update(bot, Update.model_validate(data, context={"bot": bot}))
+                except Exception as e:
+                    print(f"Journal: replay of update {data.get('update_id')} failed: {e}")
+
+        await asyncio.gather(*(feed(data) for data in updates))
+        print("Journal: replay finished")
+
+    def start_replay(self, dispatcher: Dispatcher, bot: Bot, concurrency: int):
+        """Разбор хвоста в фоне, чтобы не задерживать приём новых апдейтов"""
+        self.replay_task = asyncio.create_task(self.replay(dispatcher, bot, concurrency))
+
+
+journal = UpdateJournal(JOURNAL_PATH)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from aiogram.types import Message, Update
+
+
+class MediaGroupCollector:
+    """Собирает альбом (несколько апдейтов с одним media_group_id) в один список.
+
+    Первый кусок альбома, дошедший до хендлера, вызывает collect() и становится
+    его владельцем: ждёт, пока delay секунд не придёт ни одного нового куска,
+    и получает все сообщения альбома по порядку. Остальные куски получают None —
+    их хендлер просто выходит.
+
+    Апдейты одного чата обрабатываются строго по очереди (ChatEventIsolation),
+    поэтому куски, которые пришли раньше, чем владелец начал ждать, стоят в
+    очереди чата за ним. offer() отмечает их на входе, и владелец забирает их
+    оттуда. Куски, пришедшие, пока владелец ждёт, отдаются ему сразу, мимо
+    очереди. Если первый кусок ушёл в хендлер без collect(), остальные идут
+    по очереди как обычные апдейты.
+    """
+
+    def __init__(self, delay: float = 1.0, stale_after: float = 60.0):
+        self.delay = delay
+        self.stale_after = stale_after
+        self.groups: Dict[tuple, dict] = {}   # Альбомы, которые сейчас собирает владелец
+        # key -> {message_id: (время, сообщение)}: куски в очереди чата и куски, уже забранные владельцем
+        self.queued: Dict[tuple, dict] = {}
+        self.claimed: Dict[tuple, dict] = {}
+
+    @staticmethod
+    def _key(message: Message) -> tuple:
+        return message.chat.id, message.media_group_id
+
+    def _sweep(self):
+        """Отметки о кусках, которые так и не дошли до collect() (ушли в другой хендлер)"""
+        expired = time.monotonic() - self.stale_after
+        for registry in (self.queued, self.claimed):
+            for key in list(registry):
+                entries = registry[key]
+                for message_id in [m for m, (seen, _) in entries.items() if seen < expired]:
+                    del entries[message_id]
+                if not entries:
+                    del registry[key]
+
+    def offer(self, update: Update) -> bool:
+        """Для входа апдейтов (IntakeMiddleware): True — кусок отдан владельцу,
+        который уже ждёт альбом, и в очередь чата ставить апдейт не нужно"""
+        message = update.message
+        if message is None or not message.media_group_id:
+            return False
+
+        key = self._key(message)
+        group = self.groups.get(key)
+        if group is not None:
+            self._join(group, message)
+            return True
+
+        if self.queued or self.claimed:
+            self._sweep()
+        self.queued.setdefault(key, {})[message.message_id] = (time.monotonic(), message)
+        return False
+
+    def _join(self, group: dict, message: Message):
+        group["messages"].append(message)
+        group["deadline"] = time.monotonic() + self.delay
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        if not message.media_group_id:
+            return [message]
+
+        key = self._key(message)
+        claimed = self.claimed.get(key)
+        if claimed is not None and claimed.pop(message.message_id, None) is not None:
+            if not claimed:
+                del self.claimed[key]
+            return None  # Этот кусок уже в альбоме владельца
+
+        group = self.groups.get(key)
+        if group is not None:
+            # Кусок без отметки offer (например, апдейт прогнали мимо очереди)
+            self._join(group, message)
+            return None
+
+        # Владелец: забираем куски, которые ждут в очереди чата за нами
+        waiting = self.queued.pop(key, {})
+        waiting.pop(message.message_id, None)
+        group = {"messages": [message], "deadline": time.monotonic() + self.delay}
+        self.groups[key] = group
+        if waiting:
+            group["messages"].extend(queued for _, queued in waiting.values())
+            self.claimed.setdefault(key, {}).update(waiting)
+
+        try:
+            # Дебаунс: каждый новый кусок альбома отодвигает срок
+            while (wait := group["deadline"] - time.monotonic()) > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self.groups.pop(key, None)
+        return sorted(group["messages"], key=lambda m: m.message_id)
+
+
+media_groups = MediaGroupCollector()
@@ -0,0 +1,138 @@
+"""Метрики в формате Prometheus (text exposition 0.0.4), без внешних зависимостей.
+
+Гистограммы и счётчики копятся в памяти процесса; gauges считаются в момент
+запроса /metrics через зарегистрированные функции (см. register_gauge).
+"""
+import re
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+from aiohttp import web
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [counts по бакетам..., sum, count]
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in self.series.items():
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {count}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {series[-1]}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self.series.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+handler_latency = Histogram("bot_handler_seconds", "Время работы хендлера", ("handler",))
+db_query_latency = Histogram("bot_db_query_seconds", "Время SQL-запроса", ("engine", "operation", "table"), DB_BUCKETS)
+api_latency = Histogram("bot_api_seconds", "Время вызова Bot API (без ожидания в очереди)", ("method",))
+api_errors = Counter("bot_api_errors_total", "Ошибки Bot API", ("method", "error"))
+api_retries = Counter("bot_api_retries_total", "Повторов Bot API после 429", ("method",))
+api_queue_wait = Histogram("bot_api_queue_wait_seconds", "Ожидание вызова Bot API в очереди", ("priority",))
+handler_errors = Counter("bot_handler_errors_total", "Исключения в хендлерах", ("handler",))
+
+METRICS = [handler_latency, handler_errors, db_query_latency, api_latency, api_errors, api_retries, api_queue_wait]
+
+# name -> (documentation, функция, возвращающая [(labels dict, value), ...])
+_gauges: Dict[str, tuple] = {}
+
+
+def register_gauge(name: str, documentation: str, collect: Callable[[], Iterable[Tuple[dict, float]]]):
+    _gauges[name] = (documentation, collect)
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, (documentation, collect) in _gauges.items():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        try:
+            for labels, value in collect():
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        except Exception as e:
+            print(f"Metrics: gauge {name} failed: {e}")
+    return '\n'.join(lines) + '\n'
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+# --- SQLAlchemy ---
+_OPERATION_RE = re.compile(r'^\s*(\w+)')
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?"?(\w+)', re.IGNORECASE)
+
+
+def _describe(statement: str) -> tuple:
+    operation = _OPERATION_RE.match(statement)
+    table = _TABLE_RE.search(statement)
+    return (operation.group(1).upper() if operation else "?"), (table.group(1) if table else "-")
+
+
+def instrument_engine(engine, name: str):
+    """Вешает на движок хуки, замеряющие каждый запрос"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    # На соединении запросы идут строго по очереди, так что хватает одного слота
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is not None:
+            db_query_latency.observe(time.perf_counter() - started, name, *_describe(statement))
@@ -0,0 +1,219 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update, User
+
+from database.requests import admin_ids, ban_index, profile_fingerprints, upsert_users
+from utils.cache import LRUCache
+from utils.journal import journal
+from utils.config import (
+    THROTTLE_WINDOW, THROTTLE_USER_LIMIT, THROTTLE_GLOBAL_LIMIT, THROTTLE_BAN_AFTER, THROTTLE_BAN_MINUTES
+)
+from utils.metrics import handler_errors, handler_latency
+from utils.ratelimit import SlidingWindow
+
+
+class BanMiddleware(BaseMiddleware):
+    """Отбрасывает апдейты от забаненных ещё до хендлеров и запросов в БД"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id not in ban_index:
+            return await handler(event, data)
+
+        # На нажатие кнопки всё же отвечаем, чтобы у пользователя не висели "часики"
+        if isinstance(event, Update) and event.callback_query:
+            try:
+                await event.callback_query.answer("⛔ Вы заблокированы.", show_alert=True)
+            except Exception:
+                pass
+
+
+class JournalMiddleware(BaseMiddleware):
+    """Отмечает апдейт в журнале обработанным и отбрасывает повторы (вешается первым на dp.update)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not journal.begin(event):
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            # Упавший хендлер тоже считаем обработанным, иначе апдейт повторялся бы на каждом старте
+            journal.finish(event.update_id)
+
+
+class IntakeMiddleware(BaseMiddleware):
+    """Забирает апдейты до очереди чата (вешается на dp.update перед FSM-middleware).
+
+    intake(update) -> True: апдейт уже забрал тот, кто ждёт его внутри очереди
+    этого чата (например, сборщик альбома), и дальше его не пускаем.
+    """
+
+    def __init__(self, intake: Callable[[Update], bool]):
+        self.intake = intake
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self.intake(event):
+            return None
+        return await handler(event, data)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Гистограмма времени работы по каждому хендлеру (вешается как inner middleware)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, name)
+
+
+class ProfileRefreshMiddleware(BaseMiddleware):
+    """Подтягивает username/full_name из любого апдейта и пишет в БД пачками"""
+
+    def __init__(self, flush_interval: float = 0.3, max_batch: int = 500):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending: Dict[int, tuple] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.touch(user)
+        return await handler(event, data)
+
+    def touch(self, user: User):
+        fingerprint = (user.username, user.full_name)
+        if self.pending.get(user.id) == fingerprint or profile_fingerprints.get(user.id) == fingerprint:
+            return
+
+        # Отпечаток ставим только после записи: пока её нет, add_user пишет профиль сам
+        self.pending[user.id] = fingerprint
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        while self.pending:
+            batch = {}
+            for tg_id in list(self.pending)[:self.max_batch]:
+                batch[tg_id] = self.pending.pop(tg_id)
+
+            try:
+                await upsert_users(batch)
+            except Exception as e:
+                # Отпечатков нет — следующий апдейт этих пользователей попробует ещё раз
+                print(f"Profile refresh failed for {len(batch)} users: {e}")
+                continue
+            for tg_id, fingerprint in batch.items():
+                profile_fingerprints.set(tg_id, fingerprint)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Защита от флуда: лимиты на пользователя и на весь бот (outer на dp.message и dp.callback_query).
+
+    Лишние апдейты отбрасываются до хендлеров всех роутеров, то есть до записи
+    в БД и вызовов API. Кто продолжает долбить после лимита, получает временный
+    бан (только в памяти). Админы не ограничиваются.
+
+    Счётчики живут в памяти процесса. В режиме воркеров личный чат пользователя
+    всегда у одного воркера, так что лимит на пользователя точный, а общий
+    лимит каждому воркеру задают его долей (см. main.py).
+    """
+
+    def __init__(
+        self,
+        user_limit: int = THROTTLE_USER_LIMIT,
+        global_limit: int = THROTTLE_GLOBAL_LIMIT,
+        window: float = THROTTLE_WINDOW,
+        ban_after: int = THROTTLE_BAN_AFTER,
+        ban_minutes: float = THROTTLE_BAN_MINUTES,
+    ):
+        self.per_user = SlidingWindow(user_limit, window)
+        self.overall = SlidingWindow(global_limit, window, maxsize=1)
+        self.strikes = SlidingWindow(ban_after, window) if ban_after else None
+        self.ban_seconds = ban_minutes * 60
+        self.temp_bans = LRUCache(maxsize=100000, ttl=self.ban_seconds)
+        # Кого уже предупредили в этом окне — чтобы не тратить API на каждое сообщение
+        self.warned = LRUCache(maxsize=100000, ttl=window)
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id in admin_ids:
+            return await handler(event, data)
+
+        if self.temp_bans.get(user.id):
+            return await self._reject(event, user.id, None)
+
+        if not self.per_user.hit(user.id):
+            if self.strikes is not None and not self.strikes.hit(user.id):
+                self.temp_bans.set(user.id, True)
+                print(f"Throttling: user {user.id} temporarily banned for flood")
+                return await self._reject(
+                    event, user.id, f"⛔ Слишком много сообщений. Бот не отвечает вам {int(self.ban_seconds // 60)} мин.",
+                    always=True,
+                )
+            return await self._reject(event, user.id, "⏳ Слишком часто. Подождите немного.")
+
+        if not self.overall.hit():
+            # Бот перегружен: сообщениями не отвечаем вовсе, бережём лимиты API
+            return await self._reject(event, None, "🚦 Бот перегружен, попробуйте через минуту.")
+
+        return await handler(event, data)
+
+    async def _reject(self, event: TelegramObject, warn_user_id: Optional[int], text: Optional[str], always: bool = False):
+        self.dropped += 1
+        try:
+            if isinstance(event, CallbackQuery):
+                # На кнопку ответить нужно в любом случае, иначе у пользователя висят "часики"
+                await event.answer(text)
+            elif isinstance(event, Message) and text and warn_user_id is not None:
+                if always or not self.warned.get(warn_user_id):
+                    self.warned.set(warn_user_id, True)
+                    await event.answer(text)
+        except Exception:
+            pass
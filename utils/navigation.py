@@ -0,0 +1,115 @@
+"""callback_data админки и навигация «назад» без вложенных путей.
+
+Раньше кнопка несла в себе весь путь возврата (ban_<id>_profile_<id>_view_...),
+строка росла с глубиной и упиралась в лимит Telegram в 64 байта. Теперь
+callback_data — типизированные CallbackData фиксированной длины, а экран,
+куда вернуться, лежит на сервере: NavigationStore хранит packed callback_data
+экрана под коротким токеном. У экрана, на который ведёт токен, в callback_data
+опять только токен своего родителя — так получается стек любой глубины.
+
+Так же, по токену, хранится текст поискового запроса для страниц результатов:
+он не зависит от FSM, и «Домой» или ответ пользователю поиск не сбрасывают.
+
+Токен — хэш packed-строки, поэтому один и тот же экран всегда даёт один и тот
+же токен: закэшированная страница списка (render_cache) годится всем админам,
+а хэндлер лишь регистрирует её токен за текущим админом (remember).
+"""
+import base64
+import hashlib
+from typing import Dict, Optional
+
+from aiogram.filters.callback_data import CallbackData
+
+from utils.cache import LRUCache
+
+
+class ListCb(CallbackData, prefix="menu"):
+    list_type: str  # feedback, report, users, banned
+    page: str       # Токен страницы, см. parse_page_token
+
+
+class ItemCb(CallbackData, prefix="view"):
+    item_type: str
+    item_id: int
+    back: str = ""  # Пусто — к первой странице списка
+
+
+class ProfileCb(CallbackData, prefix="profile"):
+    tg_id: int
+    back: str = ""  # Пусто — домой
+
+
+class BanCb(CallbackData, prefix="ban"):
+    tg_id: int
+    ban: bool
+    back: str  # Экран, который перерисовать после бана
+
+
+class DmCb(CallbackData, prefix="dm"):
+    tg_id: int
+    back: str = ""  # back профиля, в который вернёт «Отмена»
+
+
+class ReplyCb(CallbackData, prefix="reply"):
+    tg_id: int
+    item_id: int
+
+
+class ClusterCb(CallbackData, prefix="cluster"):
+    cluster_id: int
+    page: int
+    back: str = ""  # Карточка, из которой открыли похожие
+
+
+class SearchCb(CallbackData, prefix="search"):
+    item_type: str
+
+
+class SearchPageCb(CallbackData, prefix="srch"):
+    item_type: str
+    page: int
+    query: str  # Токен текста запроса в NavigationStore (сам текст в 64 байта не влезет)
+
+
+class BroadcastCb(CallbackData, prefix="bc"):
+    action: str  # status, stop
+    broadcast_id: int
+
+
+def screen_token(packed: str) -> str:
+    """Короткий стабильный токен экрана (8 символов)"""
+    return base64.urlsafe_b64encode(hashlib.blake2b(packed.encode(), digest_size=6).digest()).decode()
+
+
+class NavigationStore:
+    """Экраны для кнопок «назад»: на каждого админа свой LRU токен -> packed callback_data.
+
+    Токены, вытесненные из LRU (или потерянные при рестарте), не ломают
+    кнопку: resolve отдаёт default, и админ попадает на ближайший общий экран.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.stacks: Dict[int, LRUCache] = {}
+
+    def remember(self, user_id: int, packed: str) -> str:
+        """Запоминает экран (или текст запроса) за админом и возвращает его токен"""
+        token = screen_token(packed)
+        stack = self.stacks.get(user_id)
+        if stack is None:
+            stack = self.stacks[user_id] = LRUCache(maxsize=self.maxsize)
+        stack.set(token, packed)
+        return token
+
+    def resolve(self, user_id: int, token: str, default: Optional[str] = None) -> Optional[str]:
+        if not token:
+            return default
+        stack = self.stacks.get(user_id)
+        packed = stack.get(token) if stack is not None else None
+        return packed if packed is not None else default
+
+    def size(self) -> int:
+        return sum(len(stack) for stack in self.stacks.values())
+
+
+navigation = NavigationStore()
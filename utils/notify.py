@@ -0,0 +1,113 @@
+import asyncio
+import html
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from aiogram import Bot
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from database.requests import admin_ids
+from utils.config import NOTIFY_WINDOW, NOTIFY_MAX_PENDING
+from utils.navigation import ItemCb, ListCb
+
+ICONS = {"idea": "💡", "bug": "📝", "review": "⭐", None: "⛔"}
+TITLES = {"feedback": "📩 Фидбек", "report": "⛔ Жалобы"}
+
+
+def format_item(item_type: str, item: dict) -> str:
+    user_display = f"@{item['username']}" if item["username"] else (item["full_name"] or "Аноним")
+    preview = item["text"].replace("\n", " ")[:60] if item["text"] else f"[{item['content_type']}]"
+    return f"{ICONS.get(item['category'], '❓')} <b>#{item['id']}</b> {html.escape(user_display)}\n└ {html.escape(preview)}"
+
+
+class AdminNotifier:
+    """Сообщает админам о новом фидбеке и жалобах.
+
+    Если админу давно ничего не приходило, обращение уходит сразу. Всё, что
+    пришло за следующие window секунд, копится и уходит одной сводкой в конце
+    окна — при всплеске это одно сообщение на админа, а не по вызову API на
+    обращение. В сводке хранится не больше max_pending обращений на админа,
+    остальные только считаются. Список админов — из кэша admin_ids.
+
+    В режиме нескольких процессов у каждого воркера свой notifier, так что
+    обращения из разных воркеров в одну сводку не склеиваются.
+    """
+
+    def __init__(self, window: float = NOTIFY_WINDOW, max_pending: int = NOTIFY_MAX_PENDING):
+        self.window = window
+        self.max_pending = max_pending
+        self.pending: Dict[int, Deque[tuple]] = {}  # admin_id -> (item_type, item)
+        self.overflow: Dict[int, int] = {}          # admin_id -> не влезло в сводку
+        self.last_sent: Dict[int, float] = {}
+        self.sent = 0
+        self._bot: Optional[Bot] = None
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+
+    def push(self, item_type: str, item: dict):
+        """Слушатель database.requests.item_listeners"""
+        if self._bot is None or self.window <= 0:
+            return
+        for admin_id in admin_ids:
+            backlog = self.pending.setdefault(admin_id, deque())
+            if len(backlog) >= self.max_pending:
+                self.overflow[admin_id] = self.overflow.get(admin_id, 0) + 1
+            else:
+                backlog.append((item_type, item))
+            if admin_id in self._timers:
+                continue  # Сводка уже ждёт конца окна
+            delay = self.last_sent.get(admin_id, 0) + self.window - time.monotonic()
+            if delay <= 0:
+                self._flush_later(admin_id)
+            else:
+                self._timers[admin_id] = asyncio.get_running_loop().call_later(delay, self._flush_later, admin_id)
+
+    def pending_count(self) -> int:
+        return sum(len(backlog) for backlog in self.pending.values())
+
+    def _flush_later(self, admin_id: int):
+        self._timers.pop(admin_id, None)
+        task = asyncio.create_task(self._send(admin_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, admin_id: int):
+        items = list(self.pending.pop(admin_id, ()))
+        overflow = self.overflow.pop(admin_id, 0)
+        if not items:
+            return
+        self.last_sent[admin_id] = time.monotonic()
+
+        kb = InlineKeyboardBuilder()
+        if len(items) == 1 and not overflow:
+            item_type, item = items[0]
+            text = f"🔔 <b>Новое: {TITLES[item_type]}</b>\n\n{format_item(item_type, item)}"
+            kb.button(text="👀 Открыть", callback_data=ItemCb(item_type=item_type, item_id=item["id"]))
+        else:
+            text = f"🔔 <b>Новых обращений: {len(items) + overflow}</b>\n\n"
+            text += "\n\n".join(format_item(item_type, item) for item_type, item in items)
+            if overflow:
+                text += f"\n\n…и ещё {overflow}"
+            for item_type in dict.fromkeys(item_type for item_type, _ in items):
+                kb.button(text=TITLES[item_type], callback_data=ListCb(list_type=item_type, page="1"))
+        kb.adjust(2)
+
+        try:
+            await self._bot.send_message(admin_id, text, reply_markup=kb.as_markup(), parse_mode="HTML")
+            self.sent += 1
+        except Exception as e:
+            print(f"Notify: admin {admin_id} unreachable ({e})")
+
+    async def flush(self):
+        """На остановке: отправляет всё накопленное, не дожидаясь конца окон"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*(self._send(admin_id) for admin_id in list(self.pending)), *self._tasks)
+
+
+notifier = AdminNotifier()
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Hashable
+
+from utils.cache import LRUCache
+
+
+class TokenBucket:
+    """Token bucket: в среднем rate операций в секунду, всплесками до capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Неблокирующая попытка взять токен"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """Сколько секунд ждать, пока станет доступно tokens"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, (tokens - self.tokens) / self.rate)
+        return max(wait, self.paused_until - now)
+
+    async def acquire(self, tokens: float = 1):
+        # Лок — чтобы ждущие получали токены по очереди, а не толпой
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.delay(tokens))
+
+    def pause(self, seconds: float):
+        """Притормозить всех на seconds (например, по retry_after от Telegram)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class SlidingWindow:
+    """Лимит limit событий за window секунд на ключ (скользящее окно).
+
+    На ключ хранится всего три числа: номер текущего окна и счётчики текущего
+    и прошлого окон; прошлое учитывается с весом оставшейся в нём доли.
+    Ключи, по которым давно ничего не было, выкидывает LRU по TTL.
+    """
+
+    def __init__(self, limit: int, window: float, maxsize: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.counters = LRUCache(maxsize=maxsize, ttl=2 * window)
+
+    def hit(self, key: Hashable = None) -> bool:
+        """Учитывает событие; False — лимит исчерпан (событие не засчитано)"""
+        index, offset = divmod(time.monotonic(), self.window)
+        counter = self.counters.get(key)
+        if counter is None or counter[0] < index - 1:
+            counter = [index, 0, 0]
+        elif counter[0] == index - 1:
+            counter = [index, counter[2], 0]
+
+        allowed = counter[1] * (1 - offset / self.window) + counter[2] < self.limit
+        if allowed:
+            counter[2] += 1
+        self.counters.set(key, counter)
+        return allowed
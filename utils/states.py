@@ -5,4 +5,6 @@ class UserStates(StatesGroup):
     send_report = State()   # Для жалобы
 
 class AdminStates(StatesGroup):
-    replying = State() # Состояние ответа пользователю
\ No newline at end of file
+    replying = State() # Состояние ответа пользователю
+    broadcast = State() # Ждём сообщение для рассылки
+    search = State() # Ждём поисковый запрос
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""Несколько процессов-воркеров за одним приёмом апдейтов.
+
+Процесс-ingress один забирает апдейты (polling или вебхук), пишет их в журнал
+и раздаёт воркерам по локальному TCP-сокету, по строке JSON на сообщение.
+Воркер выбирается по chat_id, так что чат (и его FSM, очередь, лимиты)
+всегда живёт в одном процессе. Воркер подтверждает каждый апдейт (ack),
+после чего ingress отмечает его в журнале.
+
+Упавший воркер перезапускается, и ему заново отправляются все его
+неподтверждённые апдейты. Изменения общих кэшей (баны, админы, версии
+списков, см. database.requests.change_listeners) воркер шлёт ingress,
+а тот пересылает остальным воркерам.
+
+Протокол: воркер -> ingress {"hello": index}, {"ack": update_id},
+{"change": kind, "args": [...]}; ingress -> воркер {"update": {...}}, {"change": ...}.
+"""
+import asyncio
+import json
+import os
+import signal
+from typing import Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from database.requests import apply_change, change_listeners
+from utils.journal import journal
+
+POLLING_TIMEOUT = 10
+STREAM_LIMIT = 16 * 1024 ** 2  # Апдейт с длинным текстом и разметкой легко больше 64 КБ по умолчанию
+
+
+def _encode(message: dict) -> bytes:
+    return (json.dumps(message, ensure_ascii=False, separators=(',', ':')) + '\n').encode()
+
+
+def worker_for(chat_id: int, size: int) -> int:
+    """Номер воркера, которому принадлежит чат"""
+    return chat_id % size
+
+
+def shard_key(update: Update) -> int:
+    """chat_id апдейта (или id пользователя, если чата нет)"""
+    event = update.event
+    chat = getattr(event, 'chat', None) or getattr(getattr(event, 'message', None), 'chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, 'from_user', None)
+    return user.id if user else 0
+
+
+class WorkerProcess:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.unacked: Dict[int, dict] = {}  # update_id -> апдейт, в порядке отправки
+        self.restarts = 0
+
+    def send(self, message: dict):
+        if self.writer is not None:
+            self.writer.write(_encode(message))
+
+
+class WorkerPool:
+    """Сторона ingress: запускает воркеров, раздаёт им апдейты и следит, чтобы они были живы"""
+
+    def __init__(self, size: int, command: List[str], backlog: int):
+        self.workers = [WorkerProcess(i) for i in range(size)]
+        self.command = command
+        self.backlog = backlog
+        self.closing = False
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._supervisors: List[asyncio.Task] = []
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._all_connected = asyncio.Event()
+
+    def unacked(self) -> int:
+        return sum(len(worker.unacked) for worker in self.workers)
+
+    # --- Процессы ---
+    async def start(self):
+        self._server = await asyncio.start_server(self._on_connect, '127.0.0.1', 0, limit=STREAM_LIMIT)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._supervisors = [asyncio.create_task(self._supervise(worker)) for worker in self.workers]
+
+    async def wait_ready(self, timeout: float = 60):
+        """Ждёт, пока подключатся все воркеры, чтобы не забирать апдейты, которые некому обработать"""
+        try:
+            await asyncio.wait_for(self._all_connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            print("Not all workers connected in time, starting anyway")
+
+    async def _supervise(self, worker: WorkerProcess):
+        env = dict(os.environ, worker_index=str(worker.index), worker_port=str(self.port))
+        failures = 0
+        while not self.closing:
+            worker.process = await asyncio.create_subprocess_exec(*self.command, env=env)
+            code = await worker.process.wait()
+            worker.writer = None
+            if self.closing:
+                return
+            worker.restarts += 1
+            failures += 1
+            delay = min(30, 2 ** min(failures, 5))
+            print(f"Worker {worker.index} exited with code {code}, restarting in {delay}s")
+            await asyncio.sleep(delay)
+
+    async def close(self, timeout: float = 15):
+        """Останавливает воркеров (SIGTERM — они дорабатывают начатое) и сокет"""
+        self.closing = True
+        for worker in self.workers:
+            if worker.process and worker.process.returncode is None:
+                worker.process.send_signal(signal.SIGTERM)
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                await asyncio.wait_for(worker.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                worker.process.kill()
+        for task in self._supervisors:
+            task.cancel()
+        if self._server:
+            self._server.close()
+
+    # --- Связь с воркерами ---
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = json.loads(await reader.readline() or b'{}')
+        if 'hello' not in hello:
+            writer.close()
+            return
+        worker = self.workers[hello['hello']]
+        worker.writer = writer
+        if all(w.writer is not None for w in self.workers):
+            self._all_connected.set()
+        # Всё, что прежний процесс не успел подтвердить, — заново и в том же порядке
+        for data in worker.unacked.values():
+            worker.send({'update': data})
+
+        while line := await reader.readline():
+            message = json.loads(line)
+            if 'ack' in message:
+                self._ack(worker, message['ack'])
+            elif 'change' in message:
+                for other in self.workers:
+                    if other is not worker:
+                        other.send(message)
+        if worker.writer is writer:
+            worker.writer = None
+
+    def _ack(self, worker: WorkerProcess, update_id: int):
+        if worker.unacked.pop(update_id, None) is not None:
+            journal.finish(update_id)
+        if self.unacked() < self.backlog:
+            self._has_room.set()
+
+    def dispatch(self, update: Update):
+        """Отдаёт апдейт воркеру его чата (повторы update_id отбрасывает журнал)"""
+        if not journal.begin(update):
+            return
+        worker = self.workers[worker_for(shard_key(update), len(self.workers))]
+        data = journal.pending[update.update_id]
+        worker.unacked[update.update_id] = data
+        worker.send({'update': data})
+        if self.unacked() >= self.backlog:
+            self._has_room.clear()
+
+    def replay(self):
+        """Незавершённые апдейты прошлого запуска — воркерам, как будто пришли только что"""
+        for update_id, data in sorted(journal.pending.items()):
+            self.dispatch(Update.model_validate(data))
+
+    # --- Приём апдейтов ---
+    async def poll(self, bot: Bot, allowed_updates: list):
+        """Long polling, который не берёт новые апдейты, пока воркеры не разберут backlog"""
+        offset = None
+        failures = 0
+        while True:
+            await self._has_room.wait()
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates)
+            except Exception as e:
+                failures += 1
+                print(f"Polling failed ({e}), retrying")
+                await asyncio.sleep(min(5, failures))
+                continue
+            failures = 0
+            for update in updates:
+                offset = update.update_id + 1
+                self.dispatch(update)
+
+    def webhook_handler(self, bot: Bot, secret: str):
+        async def handle(request: web.Request) -> web.Response:
+            if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+                return web.Response(status=401)
+            update = Update.model_validate(await request.json(), context={'bot': bot})
+            await journal.record([update])
+            self.dispatch(update)
+            return web.Response()
+        return handle
+
+
+async def run_worker(dispatcher: Dispatcher, bot: Bot, index: int, port: int):
+    """Сторона воркера: принимает апдейты от ingress и подтверждает обработанные"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=STREAM_LIMIT)
+
+    def send(message: dict):
+        if not writer.is_closing():
+            writer.write(_encode(message))
+
+    send({'hello': index})
+    change_listeners.append(lambda kind, args: send({'change': kind, 'args': list(args)}))
+
+    tasks = set()
+
+    async def handle(data: dict):
+        try:
+            await dispatcher.feed_update(bot, Update.model_validate(data, context={'bot': bot}))
+        except Exception as e:
+            print(f"Worker {index}: update {data.get('update_id')} failed: {e}")
+        finally:
+            send({'ack': data['update_id']})
+
+    async def read():
+        while line := await reader.readline():
+            message = json.loads(line)
+            if 'update' in message:
+                task = asyncio.create_task(handle(message['update']))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            elif 'change' in message:
+                apply_change(message['change'], message['args'])
+
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    await dispatcher.emit_startup(bot=bot, bots=[bot], dispatcher=dispatcher)
+    print(f"Worker {index} started")
+    reading = asyncio.create_task(read())
+    try:
+        # Ingress закрыл сокет (упал или остановился) — тоже выходим
+        await asyncio.wait([reading, asyncio.create_task(stop.wait())], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        reading.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=10)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+        await dispatcher.emit_shutdown(bot=bot, bots=[bot], dispatcher=dispatcher)
+        await bot.session.close()